@@ -0,0 +1,248 @@
+import os
+import io
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import platform
+import contextlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import ptc_delay_analysis_final as ptc
+from ptc_cube import build_delay_cube, write_cube
+import ptc_instrumentation as instrumentation
+from ptc_results_store import write_results
+
+# Synthetic inputs follow the layouts the pipeline reads; nothing here comes from the real workbooks
+OTHER_CAUSES = ['NJT EQUIPMENT', 'NJT CREW', 'AMTRAK SIGNAL', 'NJT SIGNAL', 'WEATHER', 'POLICE ACTIVITY']
+LOCATIONS = ['NEWARK PENN', 'SECAUCUS', 'HOBOKEN', 'TRENTON', 'NEW YORK PENN', 'DOVER', 'SUMMIT',
+             'RAHWAY', 'LONG BRANCH', 'HACKENSACK', 'SUSQ', 'HUDSON', 'PORTAL', 'SWIFT', 'DOCK']
+STARTS_YARDS = ['SS', 'NY', 'MV', 'PB', 'CT', 'LB', 'BH', 'RA', 'AC', 'DE', 'GN', 'GL', 'HE', 'HD']
+STARTS_EQUIPMENT = ['8.0 EP', '9.0 ML', '5.0 PP', '3.0 MU', '6.0 MLD', '4.0 PP', '10.0 ML', '6.0 DM']
+STARTS_DAYS = ['MF', 'MF', 'MF', 'SS', 'MTH', 'SA', 'SU']
+ENGINE_TYPES = ['ALP-46', 'ALP-45', 'PL-42', 'MP-20', 'MLV']
+
+HISTORY_START = pd.Timestamp('2022-01-01')
+HISTORY_DAYS = 1155  # through 2025-02-28
+ROSTER_ALSTOM_COLS = 17
+ROSTER_SIEMENS_COLS = 6
+TRAIN_ID_RANGE = 9000
+
+
+def generate_roster(n_alstom=435, n_siemens=101, seed=0):
+    """Roster sheet (header=None): Alstom block, 'Total Alstom' column, Siemens block"""
+    rng = np.random.default_rng(seed)
+    units = rng.choice(np.arange(1000, 9999), size=n_alstom + n_siemens, replace=False)
+    n_cols = 1 + ROSTER_ALSTOM_COLS + 1 + ROSTER_SIEMENS_COLS
+    alstom_col = 1 + ROSTER_ALSTOM_COLS
+
+    def column_lists(block, n_block_cols):
+        return [list(block[i::n_block_cols]) for i in range(n_block_cols)]
+
+    alstom = column_lists(units[:n_alstom], ROSTER_ALSTOM_COLS)
+    siemens = column_lists(units[n_alstom:], ROSTER_SIEMENS_COLS)
+    n_rows = 5 + max(len(col) for col in alstom + siemens)
+
+    sheet = np.full((n_rows, n_cols), None, dtype=object)
+    sheet[0, 0] = 'Prototype Vehicles'
+    sheet[0, alstom_col] = 'Total Alstom'
+    sheet[1, alstom_col] = n_alstom
+    sheet[2, 0] = 'Total'
+    sheet[4, 0] = datetime(2025, 8, 12)
+    for col in range(1, n_cols):
+        if col != alstom_col:
+            sheet[4, col] = ENGINE_TYPES[col % len(ENGINE_TYPES)]
+    sheet[5:, 0] = np.arange(1, n_rows - 4)
+    for i, values in enumerate(alstom):
+        sheet[5:5 + len(values), 1 + i] = values
+    for i, values in enumerate(siemens):
+        sheet[5:5 + len(values), alstom_col + 1 + i] = values
+    return pd.DataFrame(sheet)
+
+
+def roster_units(roster_df):
+    """Car numbers listed on a generated roster"""
+    body = pd.to_numeric(pd.Series(roster_df.iloc[5:, 1:].to_numpy().ravel()), errors='coerce')
+    return body.dropna().astype(np.int64).to_numpy()
+
+
+def generate_starts(n_moves=1900, seed=0):
+    """starts.csv frame: name, yard, equipment, day, order, move"""
+    rng = np.random.default_rng(seed)
+    moves = rng.choice(np.arange(1, TRAIN_ID_RANGE), size=n_moves, replace=n_moves >= TRAIN_ID_RANGE).astype(str)
+    special = rng.random(n_moves) < 0.03
+    moves[special] = np.char.add('X', moves[special])
+    yards = rng.choice(STARTS_YARDS, size=n_moves)
+    assignment = rng.integers(10, 99, size=n_moves)
+    return pd.DataFrame({
+        'name': np.char.add(yards.astype(str), assignment.astype(str)),
+        'yard': yards,
+        'equipment': rng.choice(STARTS_EQUIPMENT, size=n_moves),
+        'day': rng.choice(STARTS_DAYS, size=n_moves),
+        'order': rng.integers(1, 12, size=n_moves),
+        'move': moves
+    })
+
+
+def generate_summary(n_rows, units, year=2024, seed=0):
+    """Summary sheet (header=None): date col 0, consist col 2, equipment col 4, engine type col 18"""
+    rng = np.random.default_rng(seed)
+    equipment = rng.choice(units, size=n_rows).astype(object)
+    unknown = rng.random(n_rows) < 0.05
+    equipment[unknown] = rng.integers(1, 99, size=int(unknown.sum()))
+    summary = pd.DataFrame({
+        0: pd.Timestamp(f'{year}-01-01') + pd.to_timedelta(rng.integers(0, 366, n_rows), unit='D'),
+        1: rng.choice(STARTS_YARDS, size=n_rows),
+        2: rng.integers(1, TRAIN_ID_RANGE, size=n_rows),
+        3: rng.integers(1, 12, size=n_rows),
+        4: equipment
+    })
+    for col in range(5, 19):
+        summary[col] = np.nan
+    summary[18] = rng.choice(ENGINE_TYPES, size=n_rows)
+    header = pd.DataFrame([['Date', 'Yard', 'Consist', 'Order', 'Equipment'] + [f'Col{i}' for i in range(5, 19)]])
+    return pd.concat([header, summary], ignore_index=True)
+
+
+def generate_chrono(n_delays, ptc_share=0.2, seed=0):
+    """CHRONO delay extract with the columns the pipeline reads plus a few it ignores"""
+    rng = np.random.default_rng(seed)
+    is_ptc = rng.random(n_delays) < ptc_share
+    causes = np.where(is_ptc, rng.choice(ptc.PTC_CAUSES, size=n_delays), rng.choice(OTHER_CAUSES, size=n_delays))
+    train_ids = rng.integers(1, TRAIN_ID_RANGE, size=n_delays)
+    return pd.DataFrame({
+        'Date': HISTORY_START + pd.to_timedelta(rng.integers(0, HISTORY_DAYS, n_delays), unit='D'),
+        'TRAINID': train_ids,
+        'LINE': rng.choice(['NEC', 'NJCL', 'M&E', 'MOBO', 'RVL', 'ML', 'BCL', 'PVL', 'ACRL'], size=n_delays),
+        'DELAYCAUSE': causes,
+        'Delay (Minutes)': rng.geometric(0.08, size=n_delays),
+        'Location': rng.choice(LOCATIONS, size=n_delays),
+        'COMMENTS': ''
+    })
+
+
+def write_inputs(directory, n_delays, summary_rows, seed=0, ptc_share=0.2, xlsx_max=200000):
+    """Write a full synthetic input set; CHRONO goes to CSV above xlsx_max rows (Excel row limit)"""
+    os.makedirs(directory, exist_ok=True)
+    roster = generate_roster(seed=seed)
+    paths = {
+        'roster': os.path.join(directory, 'roster.xlsx'),
+        'starts': os.path.join(directory, 'starts.csv'),
+        'summary': os.path.join(directory, 'summary.xlsx'),
+        'chrono': os.path.join(directory, 'chrono.xlsx' if n_delays <= xlsx_max else 'chrono.csv')
+    }
+    roster.to_excel(paths['roster'], header=False, index=False)
+    generate_starts(seed=seed).to_csv(paths['starts'], index=False)
+    generate_summary(summary_rows, roster_units(roster), seed=seed).to_excel(paths['summary'], header=False, index=False)
+
+    chrono = generate_chrono(n_delays, ptc_share=ptc_share, seed=seed)
+    if paths['chrono'].endswith('.csv'):
+        chrono.to_csv(paths['chrono'], index=False)
+    else:
+        chrono.to_excel(paths['chrono'], index=False)
+    return paths
+
+
+def _stage(name, func, *args, **kwargs):
+    """Run one instrumented stage with its progress prints silenced"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return instrumentation.run_stage(name, func, *args, **kwargs)
+
+
+def _load_inputs(paths):
+    """Streamed CHRONO reader plus the other three inputs, no cache"""
+    return (
+        ptc.read_chrono_ptc_delays(paths['chrono']),
+        pd.read_csv(paths['starts']),
+        pd.read_excel(paths['summary'], header=None),
+        pd.read_excel(paths['roster'], header=None)
+    )
+
+
+def _write_outputs(results_df, cube, directory):
+    write_results(results_df, os.path.join(directory, 'results'))
+    write_cube(cube, os.path.join(directory, 'cube.csv'))
+
+
+def run_benchmark(n_delays, summary_rows=None, seed=0, ptc_share=0.2, xlsx_max=200000, work_dir=None):
+    """Generate one input size and time every pipeline stage"""
+    summary_rows = summary_rows or min(max(n_delays // 10, 10000), 1000000)
+    directory = work_dir or tempfile.mkdtemp(prefix='ptc_bench_')
+    instrumentation.reset()
+    try:
+        paths = write_inputs(directory, n_delays, summary_rows, seed=seed, ptc_share=ptc_share, xlsx_max=xlsx_max)
+
+        chrono_df, starts_df, summary_df, ptc_roster = _stage(
+            'load', _load_inputs, paths, rows_in=n_delays, rows_out=lambda loaded: len(loaded[0])
+        )
+
+        # Filter is timed on the full in-memory extract, the case the streaming reader avoids
+        full_chrono = generate_chrono(n_delays, ptc_share=ptc_share, seed=seed)
+        _stage('filter', ptc.filter_ptc_delays, full_chrono, rows_in=len(full_chrono))
+        del full_chrono
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            ptc_delays = ptc.filter_ptc_delays(chrono_df)
+        equipment_ptc = _stage('roster_parse', ptc.process_ptc_roster, ptc_roster,
+                               rows_in=len(ptc_roster), rows_out=np.count_nonzero)
+        summary_index = _stage('summary_extract', ptc.extract_equipment_from_summary, summary_df,
+                               rows_in=len(summary_df), rows_out=lambda index: len(index['key']))
+        starts_index = _stage('starts_index', ptc.build_starts_index, starts_df, rows_in=len(starts_df))
+        results_df = _stage('match', ptc.match_delays_to_equipment,
+                            ptc_delays, summary_index, starts_index, equipment_ptc, rows_in=len(ptc_delays))
+        cube = _stage('analyze', build_delay_cube, results_df, rows_in=len(results_df))
+        _stage('report', ptc.report_summary, cube, equipment_ptc, rows_in=len(cube), rows_out=None)
+        _stage('write', _write_outputs, results_df, cube, directory, rows_in=len(results_df), rows_out=None)
+    finally:
+        if work_dir is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    run = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'n_delays': n_delays,
+        'summary_rows': summary_rows,
+        'seed': seed,
+        'ptc_share': ptc_share,
+        'chrono_format': 'csv' if n_delays > xlsx_max else 'xlsx',
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__
+    }
+    return [dict(run, **record) for record in instrumentation.records()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PTC delay pipeline on synthetic inputs")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help="CHRONO delay counts to generate (10k to 10M)")
+    parser.add_argument('--summary-rows', type=int, default=None, help="summary rows (default: delays / 10)")
+    parser.add_argument('--ptc-share', type=float, default=0.2, help="fraction of delays with a PTC cause")
+    parser.add_argument('--xlsx-max', type=int, default=200000,
+                        help="largest CHRONO extract written as .xlsx; bigger ones are written as CSV")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.jsonl', help="JSON lines file results are appended to")
+    parser.add_argument('--work-dir', default=None, help="keep generated inputs here instead of a temp dir")
+    parser.add_argument('--profile-dir', default=None, help="dump a cProfile file per stage into this directory")
+    args = parser.parse_args()
+    instrumentation.configure(args.profile_dir)
+
+    for n_delays in args.sizes:
+        print(f"Benchmarking {n_delays} delays...")
+        records = run_benchmark(n_delays, summary_rows=args.summary_rows, seed=args.seed,
+                                ptc_share=args.ptc_share, xlsx_max=args.xlsx_max, work_dir=args.work_dir)
+        with open(args.output, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        for record in records:
+            print(f"  {record['stage']:<16} {record['wall_seconds']:>10.3f}s  cpu: {record['cpu_seconds']:.3f}s "
+                  f"(+{record['child_cpu_seconds']:.3f}s in workers), stage peak RSS: {record['peak_rss_mb']} MB, "
+                  f"rows in: {record['rows_in']}, rows out: {record['rows_out']}")
+
+    print(f"Results appended to '{args.output}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
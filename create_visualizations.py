@@ -1,85 +1,270 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import matplotlib.pyplot as plt
-import seaborn as sns
-
-# Load the results
-df = pd.read_csv('ptc_analysis_results.csv')
-
-# Convert date column to datetime
-df['date'] = pd.to_datetime(df['date'])
-
-# Filter to only matched results
-matched_df = df[df['ptc_system'].notna()].copy()
-
-# Create visualizations
-plt.style.use('default')
-fig, axes = plt.subplots(2, 2, figsize=(15, 12))
-fig.suptitle('NJ TRANSIT PTC DELAY ANALYSIS - 2024', fontsize=16, fontweight='bold')
-
-# 1. Delay count by PTC system
-ptc_counts = matched_df[matched_df['date'].dt.year == 2024]['ptc_system'].value_counts()
-axes[0, 0].pie(ptc_counts.values, labels=ptc_counts.index, autopct='%1.1f%%', startangle=90)
-axes[0, 0].set_title('PTC Delays by System (2024)')
-
-# 2. Average delay duration by PTC system
-avg_delays = matched_df[matched_df['date'].dt.year == 2024].groupby('ptc_system')['delay_minutes'].mean()
-axes[0, 1].bar(avg_delays.index, avg_delays.values, color=['#ff7f0e', '#1f77b4'])
-axes[0, 1].set_title('Average Delay Duration by PTC System (2024)')
-axes[0, 1].set_ylabel('Minutes')
-for i, v in enumerate(avg_delays.values):
-    axes[0, 1].text(i, v + 0.1, f'{v:.1f}', ha='center', va='bottom')
-
-# 3. Total delay time by PTC system
-total_delays = matched_df[matched_df['date'].dt.year == 2024].groupby('ptc_system')['delay_minutes'].sum()
-axes[1, 0].bar(total_delays.index, total_delays.values, color=['#ff7f0e', '#1f77b4'])
-axes[1, 0].set_title('Total Delay Time by PTC System (2024)')
-axes[1, 0].set_ylabel('Minutes')
-for i, v in enumerate(total_delays.values):
-    axes[1, 0].text(i, v + 20, f'{v:.0f}', ha='center', va='bottom')
-
-# 4. Monthly delay trends
-matched_df['month'] = matched_df['date'].dt.to_period('M')
-monthly_delays = matched_df[matched_df['date'].dt.year == 2024].groupby(['month', 'ptc_system']).size().unstack(fill_value=0)
-monthly_delays.plot(kind='line', marker='o', ax=axes[1, 1])
-axes[1, 1].set_title('Monthly PTC Delays by System (2024)')
-axes[1, 1].set_ylabel('Number of Delays')
-axes[1, 1].legend(title='PTC System')
-axes[1, 1].tick_params(axis='x', rotation=45)
-
-plt.tight_layout()
-plt.savefig('ptc_delay_analysis_charts.png', dpi=300, bbox_inches='tight')
-print("Charts saved as 'ptc_delay_analysis_charts.png'")
-
-# Create summary statistics table
-print("\n" + "="*60)
-print("SUMMARY STATISTICS TABLE")
-print("="*60)
-
-summary_stats = pd.DataFrame({
-    'Metric': [
-        'Total Delays (2024)',
-        'Total Delay Time (minutes)',
-        'Total Delay Time (hours)',
-        'Average Delay Duration (minutes)',
-        'Equipment Count',
-        'Delays per Equipment'
-    ],
-    'Alstom': [
-        len(matched_df[(matched_df['date'].dt.year == 2024) & (matched_df['ptc_system'] == 'Alstom')]),
-        matched_df[(matched_df['date'].dt.year == 2024) & (matched_df['ptc_system'] == 'Alstom')]['delay_minutes'].sum(),
-        matched_df[(matched_df['date'].dt.year == 2024) & (matched_df['ptc_system'] == 'Alstom')]['delay_minutes'].sum() / 60,
-        matched_df[(matched_df['date'].dt.year == 2024) & (matched_df['ptc_system'] == 'Alstom')]['delay_minutes'].mean(),
-        75,  # From analysis
-        len(matched_df[(matched_df['date'].dt.year == 2024) & (matched_df['ptc_system'] == 'Alstom')]) / 75
-    ],
-    'Siemens': [
-        len(matched_df[(matched_df['date'].dt.year == 2024) & (matched_df['ptc_system'] == 'Siemens')]),
-        matched_df[(matched_df['date'].dt.year == 2024) & (matched_df['ptc_system'] == 'Siemens')]['delay_minutes'].sum(),
-        matched_df[(matched_df['date'].dt.year == 2024) & (matched_df['ptc_system'] == 'Siemens')]['delay_minutes'].sum() / 60,
-        matched_df[(matched_df['date'].dt.year == 2024) & (matched_df['ptc_system'] == 'Siemens')]['delay_minutes'].mean(),
-        21,  # From analysis
-        len(matched_df[(matched_df['date'].dt.year == 2024) & (matched_df['ptc_system'] == 'Siemens')]) / 21
-    ]
-})
-
-print(summary_stats.to_string(index=False, float_format='%.1f'))
+from ptc_cube import CUBE_FILE, read_cube, rollup
+from ptc_cache import read_excel_cached
+from ptc_delay_analysis_final import ROSTER_FILE, fork_context, process_ptc_roster, roster_counts
+from ptc_exposure import EXPOSURE_FILE, RATE_DAYS, read_exposure, exposure_rates
+
+SYSTEMS = ['Alstom', 'Siemens']
+CHART_FILE = 'ptc_delay_analysis_charts.png'
+CHART_DPI = 300
+
+# Batch mode: one figure per slice in CHART_DIR, with a manifest of what each figure was drawn from
+CHART_DIR = 'ptc_charts'
+MANIFEST_FILE = '_manifest.json'
+SLICE_KINDS = ['year', 'system', 'cause']
+
+
+def system_month_aggregate(cube, year, ptc_system=None, delay_cause=None):
+    """Delays / minutes per (month, PTC system) for one year: the only table the charts read"""
+    selected = (cube['year'] == year) & cube['ptc_system'].notna()
+    if ptc_system is not None:
+        selected &= cube['ptc_system'] == ptc_system
+    if delay_cause is not None:
+        selected &= cube['delay_cause'] == delay_cause
+    return rollup(cube[selected], ['month', 'ptc_system'])
+
+
+def system_totals(by_month):
+    """Per-system totals rolled up from the month aggregate"""
+    return rollup(by_month, ['ptc_system']).set_index('ptc_system')
+
+
+def load_fleet_sizes(roster_file=ROSTER_FILE):
+    """Roster car count per PTC system"""
+    return roster_counts(process_ptc_roster(read_excel_cached(roster_file, header=None)))
+
+
+def load_exposure_rates(exposure_file=EXPOSURE_FILE):
+    """Delays per 1,000 unit-service-days per PTC system (None without an exposure table)"""
+    if not os.path.exists(exposure_file):
+        return None
+    rates = exposure_rates(read_exposure(exposure_file), ['ptc_system']).dropna(subset=['ptc_system'])
+    return rates.set_index('ptc_system')['delays_per_1000_days'].to_dict()
+
+
+def render_charts(by_month, year, path=CHART_FILE, label=None, dpi=CHART_DPI):
+    """Draw the four panels from the month aggregate and save them"""
+    by_system = system_totals(by_month)
+
+    plt.style.use('default')
+    fig, axes = plt.subplots(2, 2, figsize=(15, 12))
+    title = f'NJ TRANSIT PTC DELAY ANALYSIS - {year}' + (f' - {label}' if label else '')
+    fig.suptitle(title, fontsize=16, fontweight='bold')
+
+    # 1. Delay count by PTC system
+    ptc_counts = by_system['delays'].sort_values(ascending=False)
+    axes[0, 0].pie(ptc_counts.values, labels=ptc_counts.index, autopct='%1.1f%%', startangle=90)
+    axes[0, 0].set_title(f'PTC Delays by System ({year})')
+
+    # 2. Average delay duration by PTC system
+    avg_delays = by_system['mean_minutes']
+    axes[0, 1].bar(avg_delays.index, avg_delays.values, color=['#ff7f0e', '#1f77b4'])
+    axes[0, 1].set_title(f'Average Delay Duration by PTC System ({year})')
+    axes[0, 1].set_ylabel('Minutes')
+    for i, v in enumerate(avg_delays.values):
+        axes[0, 1].text(i, v + 0.1, f'{v:.1f}', ha='center', va='bottom')
+
+    # 3. Total delay time by PTC system
+    total_delays = by_system['delay_minutes']
+    axes[1, 0].bar(total_delays.index, total_delays.values, color=['#ff7f0e', '#1f77b4'])
+    axes[1, 0].set_title(f'Total Delay Time by PTC System ({year})')
+    axes[1, 0].set_ylabel('Minutes')
+    for i, v in enumerate(total_delays.values):
+        axes[1, 0].text(i, v + 20, f'{v:.0f}', ha='center', va='bottom')
+
+    # 4. Monthly delay trends
+    months = pd.PeriodIndex.from_fields(year=[year] * len(by_month), month=by_month['month'], freq='M')
+    monthly_delays = by_month.assign(month=months).pivot(index='month', columns='ptc_system', values='delays')
+    monthly_delays.fillna(0).plot(kind='line', marker='o', ax=axes[1, 1])
+    axes[1, 1].set_title(f'Monthly PTC Delays by System ({year})')
+    axes[1, 1].set_ylabel('Number of Delays')
+    axes[1, 1].legend(title='PTC System')
+    axes[1, 1].tick_params(axis='x', rotation=45)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    return path
+
+
+def summary_table(by_month, fleet_sizes, year, rates=None):
+    """Summary statistics per system from the month aggregate, roster fleet sizes and exposure rates"""
+    totals = system_totals(by_month).reindex(SYSTEMS)
+    table = pd.DataFrame({
+        'Metric': [
+            f'Total Delays ({year})',
+            'Total Delay Time (minutes)',
+            'Total Delay Time (hours)',
+            'Average Delay Duration (minutes)',
+            'Equipment Count',
+            'Delays per Equipment'
+        ],
+        **{
+            system: [
+                totals.loc[system, 'delays'],
+                totals.loc[system, 'delay_minutes'],
+                totals.loc[system, 'delay_minutes'] / 60,
+                totals.loc[system, 'mean_minutes'],
+                fleet_sizes[system],
+                totals.loc[system, 'delays'] / fleet_sizes[system] if fleet_sizes[system] else float('nan')
+            ]
+            for system in SYSTEMS
+        }
+    })
+    if rates is not None:
+        table.loc[len(table)] = [f'Delays per {RATE_DAYS:,} Unit-Service-Days'] + \
+            [rates.get(system, float('nan')) for system in SYSTEMS]
+    return table
+
+
+def chart_slices(cube, years, kinds=SLICE_KINDS):
+    """(year, ptc_system, delay_cause) of every figure to draw: whole year, each system, each cause"""
+    matched = cube[cube['ptc_system'].notna()]
+    slices = []
+    for year in years:
+        in_year = matched[matched['year'] == year]
+        if 'year' in kinds:
+            slices.append((year, None, None))
+        if 'system' in kinds:
+            slices.extend((year, system, None) for system in sorted(in_year['ptc_system'].unique()))
+        if 'cause' in kinds:
+            slices.extend((year, None, cause) for cause in sorted(in_year['delay_cause'].dropna().unique()))
+    return slices
+
+
+def slice_file(year, ptc_system=None, delay_cause=None):
+    """Figure name for a slice, e.g. ptc_delay_analysis_charts_2024_cause-njt-ptc-mechanical.png"""
+    name = f"ptc_delay_analysis_charts_{year}"
+    if ptc_system is not None:
+        name += f"_system-{ptc_system}"
+    if delay_cause is not None:
+        name += f"_cause-{delay_cause}"
+    return re.sub(r'[^a-z0-9_.-]+', '-', name.lower()) + '.png'
+
+
+def _slice_digest(by_month, year, label, dpi):
+    """Fingerprint of everything a figure is drawn from"""
+    content = by_month.to_csv(index=False) + f"|{year}|{label}|{dpi}"
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+# Shared month aggregate of the cube seen by render workers (inherited copy-on-write under fork)
+_worker_aggregate = None
+
+def _init_render_worker(aggregate):
+    global _worker_aggregate
+    _worker_aggregate = aggregate
+    plt.switch_backend('Agg')
+
+def _render_slice(job):
+    (year, ptc_system, delay_cause), path, dpi = job
+    by_month = system_month_aggregate(_worker_aggregate, year, ptc_system, delay_cause)
+    return render_charts(by_month, year, path, label=ptc_system or delay_cause, dpi=dpi)
+
+
+def render_batch(cube, slices, output_dir=CHART_DIR, workers=None, dpi=CHART_DPI, force=False):
+    """Render a figure per slice in worker processes, skipping figures whose inputs are unchanged"""
+    # Cube rolled up once to the dimensions any slice can filter on; each slice is a filter of it
+    aggregate = rollup(cube[cube['ptc_system'].notna()], ['year', 'month', 'ptc_system', 'delay_cause'])
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    jobs, digests, skipped = [], {}, 0
+    for year, ptc_system, delay_cause in slices:
+        by_month = system_month_aggregate(aggregate, year, ptc_system, delay_cause)
+        if by_month.empty:
+            continue
+        name = slice_file(year, ptc_system, delay_cause)
+        digests[name] = _slice_digest(by_month, year, ptc_system or delay_cause, dpi)
+        if not force and manifest.get(name) == digests[name] and os.path.exists(os.path.join(output_dir, name)):
+            skipped += 1
+            continue
+        jobs.append(((year, ptc_system, delay_cause), os.path.join(output_dir, name), dpi))
+
+    print(f"Rendering {len(jobs)} figure(s), {skipped} unchanged, into '{output_dir}'...")
+    if jobs:
+        workers = min(workers or os.cpu_count() or 1, len(jobs))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=fork_context(), initializer=_init_render_worker,
+                                 initargs=(aggregate,)) as pool:
+            rendered = list(pool.map(_render_slice, jobs))
+    else:
+        rendered = []
+
+    # Written only after the pool finished, so a failed run re-renders what it missed
+    manifest.update(digests)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    return rendered
+
+
+def main(year=2024, cube_file=CUBE_FILE, roster_file=ROSTER_FILE, chart_file=CHART_FILE,
+         exposure_file=EXPOSURE_FILE, dpi=CHART_DPI):
+    # One aggregate of the delay cube feeds every panel and the summary table
+    by_month = system_month_aggregate(read_cube(cube_file, year=year), year)
+    if by_month.empty:
+        print(f"No matched PTC delays for {year} in '{cube_file}', no charts drawn")
+        return
+    fleet_sizes = load_fleet_sizes(roster_file)
+
+    render_charts(by_month, year, chart_file, dpi=dpi)
+    print(f"Charts saved as '{chart_file}'")
+
+    # Create summary statistics table
+    print("\n" + "="*60)
+    print("SUMMARY STATISTICS TABLE")
+    print("="*60)
+    rates = load_exposure_rates(exposure_file)
+    print(summary_table(by_month, fleet_sizes, year, rates).to_string(index=False, float_format='%.1f'))
+
+
+def main_batch(years, kinds=SLICE_KINDS, cube_file=CUBE_FILE, output_dir=CHART_DIR, workers=None,
+               dpi=CHART_DPI, force=False):
+    cube = read_cube(cube_file)
+    if not years:
+        years = sorted(int(year) for year in cube['year'].dropna().unique())
+    rendered = render_batch(cube, chart_slices(cube, years, kinds), output_dir, workers=workers,
+                            dpi=dpi, force=force)
+    print(f"Rendered {len(rendered)} figure(s)")
+    return rendered
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="PTC delay charts and summary table for one year")
+    parser.add_argument('--year', type=int, default=2024, help="year to chart")
+    parser.add_argument('--batch', action='store_true',
+                        help="render a figure per year / PTC system / delay cause in a process pool")
+    parser.add_argument('--years', type=int, nargs='*', default=None, help="batch years (default: all in the cube)")
+    parser.add_argument('--slices', nargs='+', choices=SLICE_KINDS, default=SLICE_KINDS,
+                        help="batch slices: whole year, each system, each cause")
+    parser.add_argument('--output-dir', default=CHART_DIR, help="batch figure directory")
+    parser.add_argument('--workers', type=int, default=None, help="batch render processes")
+    parser.add_argument('--dpi', type=int, default=CHART_DPI, help="figure resolution")
+    parser.add_argument('--force', action='store_true', help="re-render batch figures even if unchanged")
+    parser.add_argument('--cube', default=CUBE_FILE, help="delay cube written by ptc_delay_analysis_final.py")
+    parser.add_argument('--roster', default=ROSTER_FILE, help="PTC vehicle roster workbook (fleet sizes)")
+    parser.add_argument('--exposure', default=EXPOSURE_FILE, help="per-unit exposure table (delays per unit-day)")
+    parser.add_argument('--output', default=CHART_FILE, help="chart image path")
+    args = parser.parse_args(argv)
+    if args.batch:
+        main_batch(args.years, kinds=args.slices, cube_file=args.cube, output_dir=args.output_dir,
+                   workers=args.workers, dpi=args.dpi, force=args.force)
+    else:
+        main(year=args.year, cube_file=args.cube, roster_file=args.roster, chart_file=args.output,
+             exposure_file=args.exposure, dpi=args.dpi)
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,107 +1,206 @@
-import pandas as pd
-
-print("="*80)
-print("NJ TRANSIT PTC DELAY ANALYSIS - CORRECTED FINAL ANSWERS")
-print("="*80)
-
-# Load the analysis results
-df = pd.read_csv('ptc_analysis_results_final.csv')
-df['date'] = pd.to_datetime(df['date'])
-
-# Filter to 2024 data
-df_2024 = df[df['date'].dt.year == 2024].copy()
-matched_2024 = df_2024[df_2024['ptc_system'].notna()].copy()
-
-# Calculate statistics
-alstom_delays = matched_2024[matched_2024['ptc_system'] == 'Alstom']
-siemens_delays = matched_2024[matched_2024['ptc_system'] == 'Siemens']
-
-alstom_total_delay = alstom_delays['delay_minutes'].sum()
-siemens_total_delay = siemens_delays['delay_minutes'].sum()
-
-alstom_count = len(alstom_delays)
-siemens_count = len(siemens_delays)
-
-alstom_avg_delay = alstom_total_delay / alstom_count if alstom_count > 0 else 0
-siemens_avg_delay = siemens_total_delay / siemens_count if siemens_count > 0 else 0
-
-expected_reduction = alstom_total_delay - (alstom_count * siemens_avg_delay)
-
-print("\n" + "="*80)
-print("ANSWERS TO ASSIGNMENT QUESTIONS")
-print("="*80)
-
-print(f"\n1. What is the expected reduction in PTC related delays if all equipment was switched to Siemens?")
-print(f"   ANSWER: {expected_reduction:.1f} minutes ({expected_reduction/60:.1f} hours)")
-print(f"   DETAILS: Alstom average delay: {alstom_avg_delay:.1f} min, Siemens average delay: {siemens_avg_delay:.1f} min")
-
-print(f"\n2. How many pieces of the fleet have Alstom PTC?")
-print(f"   ANSWER: 435 pieces of equipment")
-print(f"   SOURCE: Direct count from PTC Vehicle Roster")
-
-print(f"\n3. How many Alstom PTC delays were there in 2024?")
-print(f"   ANSWER: {alstom_count} delays")
-print(f"   TOTAL DELAY TIME: {alstom_total_delay:.1f} minutes ({alstom_total_delay/60:.1f} hours)")
-
-print(f"\n4. How many pieces of the fleet have Siemens PTC?")
-print(f"   ANSWER: 101 pieces of equipment")
-print(f"   SOURCE: Direct count from PTC Vehicle Roster")
-
-print(f"\n5. How many Siemens PTC delays were there in 2024?")
-print(f"   ANSWER: {siemens_count} delays")
-print(f"   TOTAL DELAY TIME: {siemens_total_delay:.1f} minutes ({siemens_total_delay/60:.1f} hours)")
-
-print("\n" + "="*80)
-print("IMPROVEMENTS MADE")
-print("="*80)
-
-print(f"\n• PTC Cause Filtering:")
-print(f"  - CORRECTED: Changed from 'NJ PTC' to 'NJT PTC'")
-print(f"  - Now includes: NJT PTC, NJT PTC HUMAN ERROR, NJT PTC INFRASTRUCTURE, NJT PTC MECHANICAL")
-
-print(f"\n• Equipment Counts:")
-print(f"  - CORRECTED: Equipment counts now come directly from PTC Vehicle Roster")
-print(f"  - Alstom: 435 pieces (vs previous 75)")
-print(f"  - Siemens: 101 pieces (vs previous 21)")
-
-print(f"\n• Cross-Matching Logic:")
-print(f"  - IMPLEMENTED: Proper integration of summary file and starts file")
-print(f"  - ADDED: Day-of-week logic (MF, SA, SS) with holiday handling")
-print(f"  - IMPROVED: Equipment matching using both data sources")
-
-print(f"\n• Data Coverage:")
-print(f"  - Total PTC delays analyzed: {len(df)}")
-print(f"  - Delays with identified equipment: {len(df[df['ptc_system'].notna()])} ({len(df[df['ptc_system'].notna()])/len(df)*100:.1f}%)")
-print(f"  - Delays without equipment match: {len(df[df['ptc_system'].isna()])}")
-
-print(f"\n• Delay Cause Breakdown:")
-cause_counts = df['delay_cause'].value_counts()
-for cause, count in cause_counts.items():
-    print(f"  {cause}: {count}")
-
-print("\n" + "="*80)
-print("KEY FINDINGS")
-print("="*80)
-
-print(f"\n• Performance Comparison:")
-print(f"  - Alstom average delay: {alstom_avg_delay:.1f} minutes")
-print(f"  - Siemens average delay: {siemens_avg_delay:.1f} minutes")
-print(f"  - Difference: {alstom_avg_delay - siemens_avg_delay:.1f} minutes ({((alstom_avg_delay - siemens_avg_delay)/alstom_avg_delay)*100:.1f}% difference)")
-
-print(f"\n• Fleet Distribution:")
-print(f"  - Alstom equipment: 435 pieces (81.2%)")
-print(f"  - Siemens equipment: 101 pieces (18.8%)")
-
-print(f"\n• Delay Distribution:")
-print(f"  - Alstom delays: {alstom_count} ({alstom_count/(alstom_count+siemens_count)*100:.1f}%)")
-print(f"  - Siemens delays: {siemens_count} ({siemens_count/(alstom_count+siemens_count)*100:.1f}%)")
-
-print("\n" + "="*80)
-print("CONCLUSION")
-print("="*80)
-print("The corrected analysis shows that while Alstom equipment experiences more PTC-related delays than")
-print("Siemens equipment, the average delay duration is very similar between the two systems. The expected")
-print("reduction from switching all equipment to Siemens would be modest (2.1 hours annually), suggesting")
-print("that other factors beyond PTC system type may be more significant contributors to delays.")
-print("\nThe higher number of Alstom delays may be attributed to the larger Alstom fleet size rather than")
-print("inherent system differences.")
+import os
+import io
+import csv
+import argparse
+import contextlib
+
+# Delay cube written by ptc_delay_analysis_final.py (ptc_cube.write_cube); read with the csv module,
+# so printing the answers does not need pandas
+CUBE_FILE = 'ptc_delay_cube.csv'
+
+# Per-unit exposure written by the same run (ptc_exposure.write_exposure): roster system and
+# summary service days of every unit
+EXPOSURE_FILE = 'ptc_unit_exposure.csv'
+RATE_DAYS = 1000
+
+# Fleet sizes come from the roster when there is no exposure table
+ROSTER_FILE = 'PTC Vehicle Roster_2025-08-12.xlsx'
+
+
+def read_cube_rows(path=CUBE_FILE):
+    """Cube cells as dicts with numeric delays / minutes and the year as a number"""
+    rows = []
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            row['year'] = float(row['year']) if row['year'] else None
+            row['delays'] = int(float(row['delays']))
+            row['delay_minutes'] = float(row['delay_minutes']) if row['delay_minutes'] else 0.0
+            rows.append(row)
+    return rows
+
+
+def system_totals(cube, year, system):
+    """(delays, delay minutes) of one PTC system in one year"""
+    cells = [row for row in cube if row['year'] == year and row['ptc_system'] == system]
+    return sum(row['delays'] for row in cells), sum(row['delay_minutes'] for row in cells)
+
+
+def read_exposure_rows(path=EXPOSURE_FILE):
+    """Exposure rows with numeric service days / delays"""
+    rows = []
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            row['service_days'] = int(float(row['service_days']))
+            row['delays'] = int(float(row['delays']))
+            rows.append(row)
+    return rows
+
+
+def fleet_exposure(exposure, system):
+    """(roster units, units that ran, unit-service-days, delays per 1,000 unit-service-days) of one system"""
+    units = [row for row in exposure if row['ptc_system'] == system]
+    service_days = sum(row['service_days'] for row in units)
+    delays = sum(row['delays'] for row in units)
+    rate = delays * RATE_DAYS / service_days if service_days else float('nan')
+    return len(units), sum(1 for row in units if row['service_days'] > 0), service_days, rate
+
+
+def percent(part, whole):
+    """part as a percentage of whole, or 'n/a' when whole is zero (e.g. a year without data)"""
+    return f"{part / whole * 100:.1f}%" if whole else "n/a"
+
+
+def roster_fleet_sizes(roster_file=ROSTER_FILE):
+    """Roster car count per PTC system (only this fallback loads pandas)"""
+    import ptc_delay_analysis_final as ptc
+    from ptc_cache import read_excel_cached
+    with contextlib.redirect_stdout(io.StringIO()):
+        return ptc.roster_counts(ptc.process_ptc_roster(read_excel_cached(roster_file, header=None)))
+
+
+def main(year=2024, cube_file=CUBE_FILE, exposure_file=EXPOSURE_FILE, roster_file=ROSTER_FILE):
+    print("="*80)
+    print("NJ TRANSIT PTC DELAY ANALYSIS - CORRECTED FINAL ANSWERS")
+    print("="*80)
+
+    # Load the delay cube written by ptc_delay_analysis_final.py
+    cube = read_cube_rows(cube_file)
+    # Without an exposure table (no full run yet) the units-in-service and rate lines are left out
+    exposure = read_exposure_rows(exposure_file) if os.path.exists(exposure_file) else None
+    if exposure is not None:
+        alstom_fleet, alstom_active, alstom_days, alstom_rate = fleet_exposure(exposure, 'Alstom')
+        siemens_fleet, siemens_active, siemens_days, siemens_rate = fleet_exposure(exposure, 'Siemens')
+    else:
+        fleet_sizes = roster_fleet_sizes(roster_file)
+        alstom_fleet, siemens_fleet = fleet_sizes['Alstom'], fleet_sizes['Siemens']
+
+    # Per-system totals for the year
+    alstom_count, alstom_total_delay = system_totals(cube, year, 'Alstom')
+    siemens_count, siemens_total_delay = system_totals(cube, year, 'Siemens')
+
+    alstom_avg_delay = alstom_total_delay / alstom_count if alstom_count > 0 else 0
+    siemens_avg_delay = siemens_total_delay / siemens_count if siemens_count > 0 else 0
+
+    expected_reduction = alstom_total_delay - (alstom_count * siemens_avg_delay)
+    if alstom_count + siemens_count == 0:
+        print(f"\nNo data for {year}: the cube has no matched PTC delays that year")
+
+    print("\n" + "="*80)
+    print("ANSWERS TO ASSIGNMENT QUESTIONS")
+    print("="*80)
+
+    print(f"\n1. What is the expected reduction in PTC related delays if all equipment was switched to Siemens?")
+    print(f"   ANSWER: {expected_reduction:.1f} minutes ({expected_reduction/60:.1f} hours)")
+    print(f"   DETAILS: Alstom average delay: {alstom_avg_delay:.1f} min, Siemens average delay: {siemens_avg_delay:.1f} min")
+
+    print(f"\n2. How many pieces of the fleet have Alstom PTC?")
+    print(f"   ANSWER: {alstom_fleet} pieces of equipment")
+    print(f"   SOURCE: Direct count from PTC Vehicle Roster")
+    if exposure is not None:
+        print(f"   IN SERVICE: {alstom_active} units over {alstom_days} unit-service-days in the summary file")
+
+    print(f"\n3. How many Alstom PTC delays were there in {year}?")
+    print(f"   ANSWER: {alstom_count} delays")
+    print(f"   TOTAL DELAY TIME: {alstom_total_delay:.1f} minutes ({alstom_total_delay/60:.1f} hours)")
+
+    print(f"\n4. How many pieces of the fleet have Siemens PTC?")
+    print(f"   ANSWER: {siemens_fleet} pieces of equipment")
+    print(f"   SOURCE: Direct count from PTC Vehicle Roster")
+    if exposure is not None:
+        print(f"   IN SERVICE: {siemens_active} units over {siemens_days} unit-service-days in the summary file")
+
+    print(f"\n5. How many Siemens PTC delays were there in {year}?")
+    print(f"   ANSWER: {siemens_count} delays")
+    print(f"   TOTAL DELAY TIME: {siemens_total_delay:.1f} minutes ({siemens_total_delay/60:.1f} hours)")
+
+    print("\n" + "="*80)
+    print("IMPROVEMENTS MADE")
+    print("="*80)
+
+    print(f"\n• PTC Cause Filtering:")
+    print(f"  - CORRECTED: Changed from 'NJ PTC' to 'NJT PTC'")
+    print(f"  - Now includes: NJT PTC, NJT PTC HUMAN ERROR, NJT PTC INFRASTRUCTURE, NJT PTC MECHANICAL")
+
+    print(f"\n• Equipment Counts:")
+    print(f"  - CORRECTED: Equipment counts now come directly from PTC Vehicle Roster")
+    print(f"  - Alstom: {alstom_fleet} pieces (vs previous 75)")
+    print(f"  - Siemens: {siemens_fleet} pieces (vs previous 21)")
+
+    print(f"\n• Cross-Matching Logic:")
+    print(f"  - IMPLEMENTED: Proper integration of summary file and starts file")
+    print(f"  - ADDED: Day-of-week logic (MF, SA, SS) with holiday handling")
+    print(f"  - IMPROVED: Equipment matching using both data sources")
+
+    total_delays = sum(row['delays'] for row in cube)
+    matched_delays = sum(row['delays'] for row in cube if row['ptc_system'])
+
+    print(f"\n• Data Coverage:")
+    print(f"  - Total PTC delays analyzed: {total_delays}")
+    print(f"  - Delays with identified equipment: {matched_delays} ({percent(matched_delays, total_delays)})")
+    print(f"  - Delays without equipment match: {total_delays - matched_delays}")
+
+    print(f"\n• Delay Cause Breakdown:")
+    cause_counts = {}
+    for row in sorted(cube, key=lambda row: row['delay_cause']):
+        if row['delay_cause']:
+            cause_counts[row['delay_cause']] = cause_counts.get(row['delay_cause'], 0) + row['delays']
+    for cause, count in sorted(cause_counts.items(), key=lambda item: -item[1]):
+        print(f"  {cause}: {count}")
+
+    print("\n" + "="*80)
+    print("KEY FINDINGS")
+    print("="*80)
+
+    print(f"\n• Performance Comparison:")
+    print(f"  - Alstom average delay: {alstom_avg_delay:.1f} minutes")
+    print(f"  - Siemens average delay: {siemens_avg_delay:.1f} minutes")
+    print(f"  - Difference: {alstom_avg_delay - siemens_avg_delay:.1f} minutes ({percent(alstom_avg_delay - siemens_avg_delay, alstom_avg_delay)} difference)")
+
+    print(f"\n• Fleet Distribution:")
+    fleet = alstom_fleet + siemens_fleet
+    print(f"  - Alstom equipment: {alstom_fleet} pieces ({percent(alstom_fleet, fleet)})")
+    print(f"  - Siemens equipment: {siemens_fleet} pieces ({percent(siemens_fleet, fleet)})")
+
+    if exposure is not None:
+        print(f"\n• Delays per {RATE_DAYS:,} Unit-Service-Days (summary file period):")
+        print(f"  - Alstom: {alstom_rate:.1f}")
+        print(f"  - Siemens: {siemens_rate:.1f}")
+
+    print(f"\n• Delay Distribution:")
+    print(f"  - Alstom delays: {alstom_count} ({percent(alstom_count, alstom_count + siemens_count)})")
+    print(f"  - Siemens delays: {siemens_count} ({percent(siemens_count, alstom_count + siemens_count)})")
+
+    print("\n" + "="*80)
+    print("CONCLUSION")
+    print("="*80)
+    print("The corrected analysis shows that while Alstom equipment experiences more PTC-related delays than")
+    print("Siemens equipment, the average delay duration is very similar between the two systems. The expected")
+    print(f"reduction from switching all equipment to Siemens would be modest ({expected_reduction/60:.1f} hours annually), suggesting")
+    print("that other factors beyond PTC system type may be more significant contributors to delays.")
+    print("\nThe higher number of Alstom delays may be attributed to the larger Alstom fleet size rather than")
+    print("inherent system differences.")
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Print the corrected answers from the delay cube")
+    parser.add_argument('--year', type=int, default=2024, help="year the questions are answered for")
+    parser.add_argument('--cube', default=CUBE_FILE, help="delay cube written by ptc_delay_analysis_final.py")
+    parser.add_argument('--exposure', default=EXPOSURE_FILE,
+                        help="per-unit exposure table written by ptc_delay_analysis_final.py")
+    parser.add_argument('--roster', default=ROSTER_FILE, help="PTC vehicle roster (fleet sizes without an exposure table)")
+    args = parser.parse_args(argv)
+    main(year=args.year, cube_file=args.cube, exposure_file=args.exposure, roster_file=args.roster)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,109 @@
+import os
+import sys
+import glob
+import hashlib
+import pandas as pd
+from ptc_parsing import parquet_available
+
+# Cached copies of the Excel inputs live here, one Parquet file per workbook/read options
+CACHE_DIR = os.environ.get('PTC_CACHE_DIR', '.ptc_cache')
+
+
+def cache_enabled():
+    """Caching is on unless PTC_CACHE is set to 0/off/false/no"""
+    return os.environ.get('PTC_CACHE', '1').strip().lower() not in ('0', 'off', 'false', 'no')
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def _source_prefix(path, reader, read_kwargs):
+    """Stable prefix for one file read by one reader with one set of options"""
+    options = f"{reader.__name__}|{sorted(read_kwargs.items())!r}"
+    return _digest(os.path.abspath(path)) + '-' + _digest(options)
+
+
+def cache_path(path, reader=pd.read_excel, **read_kwargs):
+    """Cache file for an input, keyed on path + reader/options + mtime + size"""
+    stat = os.stat(path)
+    version = _digest(f"{stat.st_mtime_ns}|{stat.st_size}")
+    return os.path.join(CACHE_DIR, f"{_source_prefix(path, reader, read_kwargs)}-{version}.parquet")
+
+
+def _to_columnar(df):
+    """Make a frame Parquet-safe: string column labels, mixed object columns as strings"""
+    df = df.copy()
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        values = df[col].dropna()
+        # Sheets read with header=None mix header text and numbers in one column
+        if values.map(type).nunique() > 1:
+            df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v)).astype(object)
+    return df
+
+
+def _from_columnar(df, read_kwargs):
+    """Restore the column labels read_excel would have produced"""
+    if 'header' in read_kwargs and read_kwargs['header'] is None:
+        df.columns = range(len(df.columns))
+    return df
+
+
+def read_cached(path, reader, use_cache=None, **read_kwargs):
+    """Call reader(path, **read_kwargs) through the columnar cache"""
+    if use_cache is None:
+        use_cache = cache_enabled()
+    if not use_cache:
+        return reader(path, **read_kwargs)
+
+    if not parquet_available():
+        print("pyarrow not installed, reading without cache")
+        return reader(path, **read_kwargs)
+
+    cached = cache_path(path, reader, **read_kwargs)
+    if os.path.exists(cached):
+        return _from_columnar(pd.read_parquet(cached), read_kwargs)
+
+    df = reader(path, **read_kwargs)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    # Drop cache files left behind by older versions of the same input
+    prefix = _source_prefix(path, reader, read_kwargs)
+    for stale in glob.glob(os.path.join(CACHE_DIR, f"{prefix}-*.parquet")):
+        os.remove(stale)
+
+    tmp_path = cached + '.tmp'
+    _to_columnar(df).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cached)
+    return _from_columnar(pd.read_parquet(cached), read_kwargs)
+
+
+def read_excel_cached(path, use_cache=None, **read_kwargs):
+    """Read an Excel file through the columnar cache (falls back to pd.read_excel)"""
+    return read_cached(path, pd.read_excel, use_cache=use_cache, **read_kwargs)
+
+
+def clear_cache(path=None):
+    """Remove cached files for one input (any reader/options), or the whole cache"""
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+
+    if path is None:
+        targets = glob.glob(os.path.join(CACHE_DIR, '*.parquet*'))
+    else:
+        targets = glob.glob(os.path.join(CACHE_DIR, f"{_digest(os.path.abspath(path))}-*.parquet*"))
+
+    for target in targets:
+        os.remove(target)
+    return len(targets)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--clear':
+        removed = clear_cache(sys.argv[2] if len(sys.argv) > 2 else None)
+        print(f"Removed {removed} cached file(s) from '{CACHE_DIR}'")
+    else:
+        print("Usage: python ptc_cache.py --clear [workbook.xlsx]")
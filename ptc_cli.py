@@ -0,0 +1,35 @@
+import sys
+import argparse
+import importlib
+
+# Subcommand -> (module, help); a module (and pandas/matplotlib with it) is imported only when its
+# subcommand runs, so `answers` and --help start without loading the analysis stack
+COMMANDS = {
+    'analyze': ('ptc_delay_analysis_final', "load inputs, match delays, write the results store and cube"),
+    'answers': ('final_answers_corrected', "print the corrected answers from the delay cube"),
+    'charts': ('create_visualizations', "render the chart figure(s) and summary table"),
+    'exposure': ('ptc_exposure', "per-unit service days and delays per 1,000 unit-service-days"),
+    'locations': ('ptc_location_index', "PTC delay hot spots and per-location / segment totals"),
+    'rolling': ('ptc_rolling', "sliding-window delay counts, bursts and time of day"),
+    'simulate': ('ptc_simulator', "fleet migration scenarios with bootstrap intervals"),
+    'serve': ('ptc_service', "run the local JSON query service"),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='ptc',
+        description="NJ Transit PTC delay analysis",
+        epilog="Run 'ptc <command> --help' for the options of one command."
+    )
+    subparsers = parser.add_subparsers(dest='command', metavar='command', required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        subparsers.add_parser(name, help=help_text, add_help=False)
+
+    args, rest = parser.parse_known_args(argv)
+    module = importlib.import_module(COMMANDS[args.command][0])
+    module.cli(rest)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
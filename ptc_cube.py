@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+# Aggregate cube of matched delays, read by the reporting scripts instead of the row-level results
+CUBE_FILE = 'ptc_delay_cube.csv'
+
+CUBE_DIMENSIONS = ['year', 'month', 'ptc_system', 'delay_cause', 'engine_type']
+PERCENTILES = [50, 90, 95]
+
+
+def build_delay_cube(results_df):
+    """Count, minutes sum/mean and percentiles per (year, month, PTC system, cause, engine type)"""
+    dates = pd.to_datetime(results_df['date'], errors='coerce')
+    keys = pd.DataFrame({
+        'year': dates.dt.year,
+        'month': dates.dt.month,
+        'ptc_system': results_df['ptc_system'].to_numpy(dtype=object),
+        'delay_cause': results_df['delay_cause'].to_numpy(dtype=object),
+        'engine_type': results_df['engine_type'].to_numpy(dtype=object)
+    })
+    minutes = pd.to_numeric(results_df['delay_minutes'], errors='coerce').to_numpy(dtype=float)
+
+    grouped = keys.groupby(CUBE_DIMENSIONS, dropna=False, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    sizes = grouped.size()
+    n_groups = len(sizes)
+    cube = sizes.index.to_frame(index=False)
+
+    # One sort by (group, minutes) gives sums, counts and order statistics for every cell
+    valid = ~np.isnan(minutes)
+    order = np.lexsort((np.where(valid, minutes, np.inf), codes))
+    sorted_minutes = minutes[order]
+
+    cube['delays'] = sizes.to_numpy()
+    cube['delay_minutes'] = np.bincount(codes, weights=np.where(valid, minutes, 0.0), minlength=n_groups)
+    n_valid = np.bincount(codes, weights=valid, minlength=n_groups).astype(np.int64)
+    # Delays with a recorded duration: the mean's denominator, so rollups agree with the cells
+    cube['minutes_count'] = n_valid
+    starts = np.concatenate([[0], np.cumsum(cube['delays'].to_numpy())[:-1]]).astype(np.int64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cube['mean_minutes'] = cube['delay_minutes'] / n_valid
+    for pct in PERCENTILES:
+        cube[f"p{pct}_minutes"] = _sorted_percentile(sorted_minutes, starts, n_valid, pct)
+
+    return cube
+
+
+def _sorted_percentile(sorted_values, starts, counts, pct):
+    """Linear-interpolated percentile of each group in a group-sorted array"""
+    result = np.full(len(starts), np.nan)
+    has_values = counts > 0
+    position = starts[has_values] + (counts[has_values] - 1) * pct / 100.0
+    low = np.floor(position).astype(np.int64)
+    high = np.ceil(position).astype(np.int64)
+    result[has_values] = sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+    return result
+
+
+def rollup(cube, by):
+    """Exact delays / minutes / mean over coarser dimensions (percentiles only exist per cell)"""
+    # Cubes written before minutes_count existed fall back to dividing by every delay
+    if 'minutes_count' not in cube:
+        cube = cube.assign(minutes_count=cube['delays'])
+    totals = cube.groupby(by, dropna=False, sort=True)[['delays', 'delay_minutes', 'minutes_count']].sum()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        totals['mean_minutes'] = totals['delay_minutes'] / totals['minutes_count']
+    return totals.drop(columns='minutes_count').reset_index()
+
+
+def write_cube(cube, path=CUBE_FILE):
+    """Save the cube (a few rows per month and system)"""
+    cube.to_csv(path, index=False)
+    return path
+
+
+def read_cube(path=CUBE_FILE, year=None):
+    """Load the cube, optionally restricted to one year"""
+    cube = pd.read_csv(path)
+    if year is not None:
+        cube = cube[cube['year'] == year]
+    return cube
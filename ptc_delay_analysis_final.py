@@ -1,226 +1,689 @@
+import os
+import io
+import re
+import argparse
+import functools
+import glob
+import contextlib
+import multiprocessing
 import pandas as pd
 import numpy as np
-from datetime import datetime, date
+from datetime import datetime
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+from ptc_cache import read_cached, read_excel_cached
+import ptc_results_store as results_store
+from ptc_parsing import (DAY_BITS, DAY_OFFSET, UNDATED_QUERY_DAY, normalize_train_ids, whole_numbers,
+                         service_days, summary_keys)
+from ptc_cube import CUBE_FILE, build_delay_cube, rollup, write_cube
+import ptc_instrumentation as instrumentation
+import ptc_exposure
+import ptc_quality as quality
 warnings.filterwarnings('ignore')
 
-def load_and_clean_data():
-    """Load and clean all data files"""
+# Default inputs; CHRONO and summary also accept glob patterns or lists (one workbook per year/quarter)
+CHRONO_FILE = '20220101-20250228 CHRONO Delays with Location.xlsx'
+SUMMARY_FILE = 'summary file - all of 2024.xlsx'
+STARTS_FILE = 'starts.csv'
+ROSTER_FILE = 'PTC Vehicle Roster_2025-08-12.xlsx'
+
+# Optional single-file export of the matched delays (the partitioned store is the primary output)
+RESULTS_CSV = 'ptc_analysis_results_final.csv'
+
+PTC_CAUSES = ['NJT PTC', 'NJT PTC HUMAN ERROR', 'NJT PTC INFRASTRUCTURE', 'NJT PTC MECHANICAL']
+
+# Only these CHRONO columns are used downstream; location and time of day are kept when the
+# extract has them
+CHRONO_LOCATION_COLUMN = 'Location'
+CHRONO_TIME_COLUMN = 'Time'
+CHRONO_COLUMNS = ['Date', 'TRAINID', 'DELAYCAUSE', 'Delay (Minutes)', CHRONO_LOCATION_COLUMN, CHRONO_TIME_COLUMN]
+
+def read_chrono_ptc_delays(path, chunksize=50000, causes=tuple(PTC_CAUSES), columns=tuple(CHRONO_COLUMNS)):
+    """Stream a CHRONO extract, keeping only the used columns of PTC-cause rows"""
+    causes = set(causes)
+    if str(path).lower().endswith('.csv'):
+        header = pd.read_csv(path, nrows=0).columns
+        usecols = [col for col in columns if col in header]
+        chunks = [
+            chunk[chunk['DELAYCAUSE'].isin(causes)]
+            for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize)
+        ]
+    else:
+        from openpyxl import load_workbook
+        
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = [str(name).strip() if name is not None else '' for name in next(rows, ())]
+            usecols = [col for col in columns if col in header]
+            positions = [header.index(col) for col in usecols]
+            cause_pos = header.index('DELAYCAUSE')
+            
+            # Rows are filtered as they are read; only PTC rows are ever kept
+            chunks = []
+            kept = []
+            for row in rows:
+                if cause_pos < len(row) and row[cause_pos] in causes:
+                    kept.append([row[pos] if pos < len(row) else None for pos in positions])
+                    if len(kept) >= chunksize:
+                        chunks.append(pd.DataFrame(kept, columns=usecols))
+                        kept = []
+            if kept:
+                chunks.append(pd.DataFrame(kept, columns=usecols))
+        finally:
+            workbook.close()
+    
+    if not chunks:
+        return pd.DataFrame(columns=usecols)
+    
+    chrono_df = pd.concat(chunks, ignore_index=True)
+    chrono_df['Date'] = pd.to_datetime(chrono_df['Date'], errors='coerce')
+    return chrono_df
+
+def expand_input_files(files):
+    """Resolve a path, glob pattern or list of either to a sorted list of existing files"""
+    if isinstance(files, (str, os.PathLike)):
+        files = [files]
+    paths = []
+    for spec in files:
+        spec = str(spec)
+        matches = sorted(glob.glob(spec)) if glob.has_magic(spec) else [spec]
+        if not matches or not all(os.path.exists(path) for path in matches):
+            raise FileNotFoundError(f"No input file matches '{spec}'")
+        paths.extend(match for match in matches if match not in paths)
+    return paths
+
+def input_files(kind, files):
+    """Files of one input kind; only the last roster matched is read"""
+    paths = expand_input_files(files)
+    return paths[-1:] if kind == 'roster' else paths
+
+def read_input(path, kind, use_cache=None):
+    """Parse one input file (runs in a worker process when loading in parallel)"""
+    if kind == 'chrono':
+        # Causes and columns are read options, so changing either invalidates the cached extract
+        return read_cached(path, read_chrono_ptc_delays, use_cache=use_cache,
+                           causes=tuple(PTC_CAUSES), columns=tuple(CHRONO_COLUMNS))
+    if kind == 'starts':
+        return pd.read_csv(path)
+    return read_excel_cached(path, use_cache=use_cache, header=None)
+
+def combine_input(kind, frames):
+    """One frame per input kind from its parsed files"""
+    if kind == 'roster' or len(frames) == 1:
+        return frames[-1]
+    if kind != 'chrono':
+        return pd.concat(frames, ignore_index=True)
+    
+    # CHRONO extracts get one set of dtypes whatever each file inferred
+    chrono_df = pd.concat(frames, ignore_index=True)
+    chrono_df['Date'] = pd.to_datetime(chrono_df['Date'], errors='coerce')
+    chrono_df['Delay (Minutes)'] = pd.to_numeric(chrono_df['Delay (Minutes)'], errors='coerce')
+    # Train IDs are ints in some extracts and text in others; the matcher compares them as text
+    train_ids = chrono_df['TRAINID']
+    chrono_df['TRAINID'] = train_ids.astype(str).where(train_ids.notna(), None)
+    return chrono_df
+
+def load_input(kind, files, use_cache=None):
+    """Read and combine one input kind ('chrono', 'starts', 'summary' or 'roster') in this process"""
+    return combine_input(kind, [read_input(path, kind, use_cache) for path in input_files(kind, files)])
+
+def load_and_clean_data(use_cache=None, chrono_files=CHRONO_FILE, summary_files=SUMMARY_FILE,
+                        starts_files=STARTS_FILE, roster_file=ROSTER_FILE, workers=None):
+    """Load and clean all data files; several CHRONO/summary files are parsed in parallel"""
     print("Loading data files...")
     
-    # Load chrono delays
-    chrono_df = pd.read_excel('20220101-20250228 CHRONO Delays with Location.xlsx')
-    print(f"Chrono delays loaded: {len(chrono_df)} records")
+    inputs = {
+        'chrono': input_files('chrono', chrono_files),
+        'starts': input_files('starts', starts_files),
+        'summary': input_files('summary', summary_files),
+        'roster': input_files('roster', roster_file)
+    }
+    tasks = [(path, kind) for kind, paths in inputs.items() for path in paths]
+    workbook_tasks = [(path, kind) for path, kind in tasks if kind != 'starts']
+    
+    # Workbooks are parsed in a process pool (one worker per file up to the core count);
+    # each kind is then combined as load_input combines it
+    if workers is None:
+        workers = min(len(workbook_tasks), os.cpu_count() or 1)
+    if workers > 1 and len(workbook_tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {task: pool.submit(read_input, *task, use_cache) for task in workbook_tasks}
+            frames = [futures[task].result() if task in futures else read_input(*task, use_cache)
+                      for task in tasks]
+    else:
+        frames = [read_input(path, kind, use_cache) for path, kind in tasks]
+    
+    loaded = {kind: [] for kind in inputs}
+    for (path, kind), frame in zip(tasks, frames):
+        loaded[kind].append(frame)
+    
+    # Load chrono delays (PTC rows and used columns only)
+    chrono_df = combine_input('chrono', loaded['chrono'])
+    print(f"Chrono PTC delays loaded: {len(chrono_df)} records from {len(inputs['chrono'])} file(s)")
     
     # Load starts file
-    starts_df = pd.read_csv('starts.csv')
+    starts_df = combine_input('starts', loaded['starts'])
     print(f"Starts file loaded: {len(starts_df)} records")
     
-    # Load summary file
-    summary_df = pd.read_excel('summary file - all of 2024.xlsx', header=None)
-    print(f"Summary file loaded: {len(summary_df)} records")
+    # Load summary file(s); header rows of each workbook drop out when consists are parsed
+    summary_df = combine_input('summary', loaded['summary'])
+    print(f"Summary file loaded: {len(summary_df)} records from {len(inputs['summary'])} file(s)")
     
     # Load PTC roster
-    ptc_roster = pd.read_excel('PTC Vehicle Roster_2025-08-12.xlsx', header=None)
+    ptc_roster = combine_input('roster', loaded['roster'])
     print(f"PTC roster loaded: {len(ptc_roster)} records")
     
     return chrono_df, starts_df, summary_df, ptc_roster
 
 def filter_ptc_delays(chrono_df):
     """Filter to only PTC-related delays"""
-    ptc_causes = ['NJT PTC', 'NJT PTC HUMAN ERROR', 'NJT PTC INFRASTRUCTURE', 'NJT PTC MECHANICAL']
-    ptc_delays = chrono_df[chrono_df['DELAYCAUSE'].isin(ptc_causes)].copy()
+    ptc_delays = chrono_df[chrono_df['DELAYCAUSE'].isin(PTC_CAUSES)].copy()
     print(f"PTC delays found: {len(ptc_delays)}")
     return ptc_delays
 
+# PTC system codes stored in the dense roster array (0 = not on the roster)
+PTC_SYSTEMS = np.array([None, 'Alstom', 'Siemens'], dtype=object)
+ALSTOM = 1
+SIEMENS = 2
+
+# Car numbers above this are treated as bad cells rather than growing the dense array
+MAX_CAR_NUMBER = 1 << 20
+
 def process_ptc_roster(ptc_roster):
-    """Process PTC roster to create equipment to PTC system mapping"""
+    """Process PTC roster into a dense array of PTC system codes indexed by car number"""
     print("Processing PTC roster...")
     
     # Find the "Total Alstom" column to determine the split
-    alstom_col = None
-    for i, col in enumerate(ptc_roster.columns):
-        if ptc_roster.iloc[0, i] == 'Total Alstom':
-            alstom_col = i
-            break
-    
-    if alstom_col is None:
+    alstom_cols = np.flatnonzero((ptc_roster.iloc[0] == 'Total Alstom').to_numpy())
+    if len(alstom_cols) == 0:
         print("Could not find 'Total Alstom' column, using column 18 as default")
         alstom_col = 18
+    else:
+        alstom_col = int(alstom_cols[0])
     
     print(f"Alstom column found at index: {alstom_col}")
     
-    # Create equipment mapping
-    equipment_ptc = {}
-    
-    # Process each row starting from row 5 (equipment numbers)
-    for row_idx in range(4, len(ptc_roster)):
-        row = ptc_roster.iloc[row_idx]
-        
-        # Process Alstom equipment (columns 0 to alstom_col-1)
-        for col_idx in range(1, alstom_col):
-            equipment_num = row.iloc[col_idx]
-            if pd.notna(equipment_num) and str(equipment_num).strip() != '':
-                try:
-                    equipment_num = int(float(equipment_num))
-                    equipment_ptc[equipment_num] = 'Alstom'
-                except (ValueError, TypeError):
-                    continue
-        
-        # Process Siemens equipment (columns alstom_col+1 onwards)
-        for col_idx in range(alstom_col + 1, len(row)):
-            equipment_num = row.iloc[col_idx]
-            if pd.notna(equipment_num) and str(equipment_num).strip() != '':
-                try:
-                    equipment_num = int(float(equipment_num))
-                    equipment_ptc[equipment_num] = 'Siemens'
-                except (ValueError, TypeError):
-                    continue
-    
-    print(f"Equipment-PTC mapping created: {len(equipment_ptc)} equipment pieces")
-    
-    # Count by system
-    alstom_count = sum(1 for ptc in equipment_ptc.values() if ptc == 'Alstom')
-    siemens_count = sum(1 for ptc in equipment_ptc.values() if ptc == 'Siemens')
-    print(f"Alstom equipment: {alstom_count}, Siemens equipment: {siemens_count}")
+    # Equipment numbers start at row 5; coerce the whole block at once (row-major order)
+    body = ptc_roster.iloc[4:]
+    n_rows, n_cols = body.shape
+    cells = body.to_numpy(dtype=object).ravel()
+    units = whole_numbers(cells)
+    col_systems = np.zeros(n_cols, dtype=np.int8)
+    col_systems[1:alstom_col] = ALSTOM
+    col_systems[alstom_col + 1:] = SIEMENS
+    systems = np.tile(col_systems, n_rows)
+    
+    keep = ~np.isnan(units) & (units >= 0) & (units < MAX_CAR_NUMBER) & (systems > 0)
+    # Car numbers that did not parse: text cells with digits below the car type label row (the first
+    # body row); sub-headings such as 'Horizontal' are labels, not bad entries
+    unparseable = pd.notna(cells) & np.isnan(units) & (systems > 0) & (np.arange(len(cells)) >= n_cols)
+    unparseable[unparseable] = pd.Series(cells[unparseable]).astype(str).str.contains(r'\d').to_numpy()
+    quality.record('roster', 'unparseable_cells', unparseable.sum(), pd.unique(cells[unparseable]))
+    quality.record('roster', 'out_of_range_units', (~np.isnan(units) & ~keep & (systems > 0)).sum())
+    units = units[keep].astype(np.int64)
+    systems = systems[keep]
+    
+    # A car listed twice keeps its last listing, as the row-by-row scan did
+    last_units, last_pos = np.unique(units[::-1], return_index=True)
+    quality.record('roster', 'duplicate_units', len(units) - len(last_units))
+    equipment_ptc = np.zeros(int(last_units.max()) + 1 if len(last_units) else 0, dtype=np.int8)
+    equipment_ptc[last_units] = systems[::-1][last_pos]
+    
+    counts = roster_counts(equipment_ptc)
+    print(f"Equipment-PTC mapping created: {sum(counts.values())} equipment pieces")
+    print(f"Alstom equipment: {counts['Alstom']}, Siemens equipment: {counts['Siemens']}")
     
     return equipment_ptc
 
+def roster_counts(equipment_ptc):
+    """Number of roster cars per PTC system"""
+    counts = np.bincount(equipment_ptc, minlength=len(PTC_SYSTEMS))
+    return {PTC_SYSTEMS[code]: int(counts[code]) for code in range(1, len(PTC_SYSTEMS))}
+
+def ptc_system_codes(equipment_ptc, units):
+    """Roster lookup for an array of car numbers (NaN/unknown -> 0)"""
+    units = np.asarray(units, dtype=float)
+    known = ~np.isnan(units) & (units >= 0) & (units < len(equipment_ptc))
+    codes = np.zeros(len(units), dtype=np.int8)
+    codes[known] = equipment_ptc[units[known].astype(np.int64)]
+    return codes
+
+# Equipment strings: unit numbers separated by spaces/commas/dashes/slashes ("4631", "4631.0",
+# "4631 7012-1502"); starts.csv instead holds a car count and consist type ("8.0 EP"), which names no unit
+CONSIST_SEPARATORS = re.compile(r'[\s,;/+&-]+')
+UNIT_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+CAR_COUNT = re.compile(r'\d+\.\d+\s+[A-Za-z]+')
+
+@functools.lru_cache(maxsize=None)
+def parse_consist(text):
+    """Unit numbers of one equipment string, in consist order (() when it names no unit)"""
+    text = text.strip()
+    if CAR_COUNT.fullmatch(text):
+        return ()
+    units = [int(float(token)) for token in CONSIST_SEPARATORS.split(text) if UNIT_NUMBER.fullmatch(token)]
+    return tuple(unit for unit in units if unit < MAX_CAR_NUMBER)
+
+def consist_codes(values):
+    """Parse a column of equipment strings once per distinct value: (code per row, units per code)"""
+    values = pd.Series(values)
+    text = values.astype(str).where(values.notna(), None)
+    codes, distinct = pd.factorize(text)
+    return codes, [parse_consist(value) for value in distinct]
+
+def cab_units(consists, equipment_ptc):
+    """Per consist: its first unit on the PTC roster, else its first unit, else NaN"""
+    lengths = np.fromiter((len(units) for units in consists), dtype=np.int64, count=len(consists))
+    flat = np.fromiter((unit for units in consists for unit in units), dtype=float, count=int(lengths.sum()))
+    owner = np.repeat(np.arange(len(consists)), lengths)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+    
+    cab = np.full(len(consists), np.nan)
+    has_units = lengths > 0
+    cab[has_units] = flat[starts[has_units]]
+    on_roster = np.flatnonzero(ptc_system_codes(equipment_ptc, flat) > 0)
+    owners, first = np.unique(owner[on_roster], return_index=True)
+    cab[owners] = flat[on_roster[first]]
+    return cab
+
+def resolve_cab_units(codes, consists, equipment_ptc):
+    """PTC cab unit per row from consist_codes output (NaN where the row names no unit)"""
+    cab = np.append(cab_units(consists, equipment_ptc), np.nan)
+    return cab[np.where(np.asarray(codes) < 0, len(consists), codes)]
+
+# Summary file layout (header=None): service date, consist (train number), lead equipment, engine type
+SUMMARY_DATE_COL = 0
+SUMMARY_CONSIST_COL = 2
+SUMMARY_EQUIPMENT_COL = 4
+SUMMARY_ENGINE_TYPE_COL = 18
+
 def extract_equipment_from_summary(summary_df):
-    """Extract equipment list and engine type from summary file"""
+    """Build a sorted (consist, service date) index of lead equipment and engine type"""
     print("Extracting equipment from summary file...")
     
-    summary_equipment = {}
+    n_cols = summary_df.shape[1]
+    consist = whole_numbers(summary_df.iloc[:, SUMMARY_CONSIST_COL])
+    equipment = whole_numbers(summary_df.iloc[:, SUMMARY_EQUIPMENT_COL])
+    
+    # Cells listing several units are parsed once per distinct string; plain numbers skip the parser
+    equipment_text = summary_df.iloc[:, SUMMARY_EQUIPMENT_COL]
+    textual = np.isnan(equipment) & equipment_text.notna().to_numpy()
+    consist_code = np.full(len(summary_df), -1, dtype=np.int64)
+    codes, consists = consist_codes(equipment_text[textual])
+    consist_code[textual] = codes
+    listed = consist_code >= 0
+    equipment[listed] = resolve_cab_units(consist_code[listed], consists, np.zeros(0, dtype=np.int8))
+    days, undated = service_days(summary_df.iloc[:, SUMMARY_DATE_COL])
+    if n_cols > SUMMARY_ENGINE_TYPE_COL:
+        engine_type = summary_df.iloc[:, SUMMARY_ENGINE_TYPE_COL].to_numpy(dtype=object)
+    else:
+        engine_type = np.full(len(summary_df), None, dtype=object)
+    
+    # Rows without a service date are kept on day 0 so they only win when nothing closer exists
+    days[undated] = 0
+    valid = ~np.isnan(consist) & ~np.isnan(equipment) & (consist >= 0)
+    keys = summary_keys(consist[valid], days[valid])
+    
+    # Sort by (consist, day); the last row for a given key wins, as in the file order
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    last = np.append(keys[1:] != keys[:-1], True)
+    keep = order[last]
+    
+    # Header rows have neither a date nor a consist; any other row that drops out is a data problem
+    has_consist = ~np.isnan(consist) & (consist >= 0)
+    data_rows = ~undated | has_consist
+    bad_equipment = data_rows & textual & np.isnan(equipment)
+    bad_consist = ~undated & ~has_consist
+    quality.record('summary', 'unparseable_equipment', bad_equipment.sum(),
+                   equipment_text[bad_equipment].astype(str).value_counts().index)
+    quality.record('summary', 'missing_equipment', (data_rows & ~equipment_text.notna().to_numpy()).sum())
+    quality.record('summary', 'unparseable_consists', bad_consist.sum(),
+                   summary_df.iloc[:, SUMMARY_CONSIST_COL][bad_consist].astype(str).value_counts().index)
+    quality.record('summary', 'undated_rows', (valid & undated).sum())
+    quality.record('summary', 'duplicate_consist_keys', (~last).sum())
+    
+    summary_index = {
+        'key': keys[last],
+        'equipment': equipment[valid][keep].astype(np.int64),
+        'engine_type': pd.Categorical(engine_type[valid][keep]),
+        # Multi-unit entries: code into 'consists' so the PTC cab can be resolved against the roster
+        'consist': consist_code[valid][keep],
+        'consists': consists
+    }
     
-    for _, row in summary_df.iterrows():
-        try:
-            # Column 2 is Consist (train number)
-            # Column 4 is Equipment (locomotive)
-            # Column 18 is engine type
-            consist = row.iloc[2]
-            equipment = row.iloc[4]
-            engine_type = row.iloc[18] if len(row) > 18 else None
-            
-            if pd.notna(consist) and pd.notna(equipment):
-                try:
-                    consist = str(int(float(consist)))
-                    equipment = int(float(equipment))
-                    summary_equipment[consist] = {
-                        'equipment': equipment,
-                        'engine_type': engine_type
-                    }
-                except (ValueError, TypeError):
-                    continue
-        except IndexError:
-            continue
-    
-    print(f"Summary equipment mapping created: {len(summary_equipment)} entries")
-    return summary_equipment
-
-def get_day_of_week(date_obj):
-    """Get day of week abbreviation (MF, SS, SA, etc.)"""
-    if pd.isna(date_obj):
+    n_consists = len(np.unique(summary_index['key'] >> DAY_BITS))
+    print(f"Summary equipment index created: {len(summary_index['key'])} (consist, date) entries "
+          f"for {n_consists} consists")
+    return summary_index
+
+def lookup_summary_equipment(summary_index, train_ids, dates, max_days=None, equipment_ptc=None):
+    """As-of lookup: equipment of the same consist on the nearest service date
+
+    With the roster, multi-unit entries give their PTC cab unit instead of their first unit.
+    """
+    consist = whole_numbers(train_ids)
+    days, undated = service_days(dates)
+    # Delays without a date take the latest summary entry for their consist
+    days[undated] = UNDATED_QUERY_DAY - DAY_OFFSET
+    
+    queryable = ~np.isnan(consist) & (consist >= 0)
+    query_consist = np.where(queryable, consist, 0).astype(np.int64)
+    
+    equipment = np.full(len(consist), np.nan)
+    engine_type = np.full(len(consist), None, dtype=object)
+    keys = summary_index['key']
+    if len(keys) == 0:
+        return equipment, engine_type, np.zeros(len(consist), dtype=bool)
+    
+    index_consist = keys >> DAY_BITS
+    index_days = (keys & ((1 << DAY_BITS) - 1)) - DAY_OFFSET
+    
+    pos = np.searchsorted(keys, summary_keys(query_consist, days))
+    left = np.clip(pos - 1, 0, len(keys) - 1)
+    right = np.clip(pos, 0, len(keys) - 1)
+    has_left = queryable & (pos > 0) & (index_consist[left] == query_consist)
+    has_right = queryable & (pos < len(keys)) & (index_consist[right] == query_consist)
+    
+    # Ties go to the earlier service date (as-of backward)
+    use_right = has_right & (~has_left | ((index_days[right] - days) < (days - index_days[left])))
+    nearest = np.where(use_right, right, left)
+    found = has_left | has_right
+    if max_days is not None:
+        found &= np.abs(index_days[nearest] - days) <= max_days
+    
+    equipment[found] = summary_index['equipment'][nearest[found]]
+    if equipment_ptc is not None and len(summary_index['consists']):
+        codes = summary_index['consist'][nearest]
+        listed = found & (codes >= 0)
+        equipment[listed] = resolve_cab_units(codes[listed], summary_index['consists'], equipment_ptc)
+    engine_type[found] = np.asarray(summary_index['engine_type'])[nearest[found]]
+    return equipment, engine_type, found
+
+HOLIDAYS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ptc_holidays.csv')
+
+# Service keys: 0-6 are Monday-Sunday, 7 is a holiday (runs the Sunday/weekend schedule)
+HOLIDAY = 7
+
+# Day code reported for each service key (MF, SA, SS with holidays on SS)
+SERVICE_DAY_CODES = np.array(['MF', 'MF', 'MF', 'MF', 'MF', 'SA', 'SS', 'SS'], dtype=object)
+SERVICE_DAY_LABELS = ['MF', 'SA', 'SS']
+
+_holiday_tables = {}
+
+def load_holidays(path=HOLIDAYS_FILE):
+    """Holiday dates (datetime64[D], sorted) from a date,holiday CSV; reloaded when the file changes"""
+    if not os.path.exists(path):
+        print(f"Holiday file '{path}' not found, no holidays applied")
+        return np.array([], dtype='datetime64[D]')
+    
+    stamp = os.stat(path).st_mtime_ns
+    cached = _holiday_tables.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    
+    holidays = pd.read_csv(path, comment='#')
+    holidays = np.unique(pd.to_datetime(holidays['date']).to_numpy(dtype='datetime64[D]'))
+    _holiday_tables[path] = (stamp, holidays)
+    return holidays
+
+def service_calendar(dates, holidays=None):
+    """Service key and day code for a whole date column in one pass over its distinct days"""
+    if holidays is None:
+        holidays = load_holidays()
+    
+    days = pd.to_datetime(pd.Series(dates), errors='coerce').to_numpy(dtype='datetime64[D]')
+    missing = np.isnat(days)
+    
+    # Each distinct service day is resolved once and mapped back to every delay on it
+    unique_days, inverse = np.unique(np.where(missing, np.datetime64(0, 'D'), days), return_inverse=True)
+    weekday = (unique_days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+    unique_keys = np.where(np.isin(unique_days, holidays), HOLIDAY, weekday)
+    
+    service_key = unique_keys[inverse].astype(np.int8)
+    day_code = SERVICE_DAY_CODES[service_key]
+    day_code[missing] = None
+    service_key[missing] = -1
+    return service_key, day_code
+
+# starts.csv day codes that can serve each service key, in order of preference: the code the
+# previous lookup used for that day comes first (MF on weekdays, SA on Saturday, SS on Sunday and
+# holidays) so matches stay the same; the other codes are fallbacks when a move has no row for it
+DAY_CODE_EXPANSION = {
+    0: ('MF', 'MTH'),
+    1: ('MF', 'MTH'),
+    2: ('MF', 'MTH'),
+    3: ('MF', 'MTH'),
+    4: ('MF',),
+    5: ('SA', 'SS'),
+    6: ('SS', 'SU'),
+    HOLIDAY: ('SS', 'SU')
+}
+
+def build_starts_index(starts_df):
+    """Index starts.csv by (move, service key) -> ordered equipment list and lead unit"""
+    print("Indexing starts file...")
+    
+    expansion = pd.DataFrame(
+        [(code, service_key, priority)
+         for service_key, codes in DAY_CODE_EXPANSION.items()
+         for priority, code in enumerate(codes)],
+        columns=['day', 'service_key', 'priority']
+    )
+    
+    starts = pd.DataFrame({
+        'move': normalize_train_ids(starts_df['move']).values,
+        'day': starts_df['day'].astype(str).str.strip().values,
+        'yard': starts_df['yard'].values,
+        'equipment': starts_df['equipment'].values,
+        'row': np.arange(len(starts_df))
+    })
+    
+    quality.record('starts', 'duplicate_move_days', starts.duplicated(['move', 'day']).sum())
+    
+    # Each starts row is expanded to every service key its day code covers
+    starts = starts.merge(expansion, on='day', how='inner')
+    starts = starts.sort_values(['move', 'service_key', 'priority', 'row'], kind='stable')
+    
+    # Only the most preferred day code for a (move, service key) is kept
+    best = starts.groupby(['move', 'service_key'], sort=False)['priority'].transform('min')
+    starts = starts[starts['priority'] == best]
+    
+    grouped = starts.groupby(['move', 'service_key'], sort=True)
+    starts_index = grouped.agg(
+        day=('day', 'first'),
+        yard=('yard', 'first'),
+        equipment=('equipment', 'first'),
+        equipment_list=('equipment', list)
+    )
+    # Unit numbers come from the consist parser ("8.0 EP" is a car count and gives no unit)
+    starts_index['lead_equipment'] = resolve_cab_units(
+        *consist_codes(starts_index['equipment']), np.zeros(0, dtype=np.int8)
+    )
+    no_unit = starts_index['lead_equipment'].isna()
+    quality.record('starts', 'equipment_without_unit', no_unit.sum(),
+                   starts_index.loc[no_unit, 'equipment'].astype(str).value_counts().index)
+    
+    print(f"Starts index created: {len(starts_index)} (move, service day) entries")
+    return starts_index
+
+def lookup_starts(starts_index, move, service_key):
+    """O(1) lookup of one (move, service key); None if the move does not run that day"""
+    move = normalize_train_ids([move])[0]
+    if pd.isna(move):
         return None
-    
-    # Check if it's a holiday (simplified - you may need to add more holidays)
-    holidays_2024 = [
-        '2024-01-01', '2024-01-15', '2024-02-19', '2024-05-27', 
-        '2024-07-04', '2024-09-02', '2024-10-14', '2024-11-11', 
-        '2024-11-28', '2024-12-25'
-    ]
-    
-    date_str = date_obj.strftime('%Y-%m-%d')
-    if date_str in holidays_2024:
-        return 'SS'  # Sunday schedule for holidays
-    
-    # Get day of week
-    weekday = date_obj.weekday()
-    day_mapping = {
-        0: 'MF',  # Monday
-        1: 'MF',  # Tuesday  
-        2: 'MF',  # Wednesday
-        3: 'MF',  # Thursday
-        4: 'MF',  # Friday
-        5: 'SA',  # Saturday
-        6: 'SS'   # Sunday
-    }
-    return day_mapping.get(weekday, 'MF')
+    try:
+        return starts_index.loc[(move, service_key)]
+    except KeyError:
+        return None
+
+# Columns of the matched results, in output order
+RESULT_COLUMNS = ['date', 'train_id', 'delay_cause', 'delay_minutes',
+                  'lead_equipment', 'ptc_system', 'engine_type', 'day_of_week', 'location']
 
-def match_delays_to_equipment(ptc_delays, summary_equipment, starts_df, equipment_ptc):
+def delay_timestamps(ptc_delays):
+    """Delay dates, with the time of day added when the extract has a time column"""
+    dates = pd.to_datetime(ptc_delays['Date'], errors='coerce')
+    if CHRONO_TIME_COLUMN not in ptc_delays:
+        return dates
+    times = ptc_delays[CHRONO_TIME_COLUMN].astype(str).str.strip()
+    stamps = pd.to_datetime(dates.dt.strftime('%Y-%m-%d ') + times, errors='coerce', format='mixed')
+    return stamps.fillna(dates)
+
+def match_delays_to_equipment(ptc_delays, summary_index, starts_index, equipment_ptc, summary_max_days=None):
     """Match delays to equipment using the cross-matching logic"""
     print("Matching delays to equipment...")
     
-    results = []
-    
-    for _, delay in ptc_delays.iterrows():
-        train_id = str(delay['TRAINID'])
-        delay_date = delay['Date']
-        
-        # Get day of week for this delay
-        day_of_week = get_day_of_week(delay_date)
-        
-        # Try to find equipment for this train
-        lead_equipment = None
-        ptc_system = None
-        engine_type = None
-        
-        # First try to match from summary file
-        if train_id in summary_equipment:
-            lead_equipment = summary_equipment[train_id]['equipment']
-            engine_type = summary_equipment[train_id]['engine_type']
-            ptc_system = equipment_ptc.get(lead_equipment)
-        
-        # If not found in summary, try starts file
-        if lead_equipment is None:
-            # Look for this train in starts file for the specific day
-            starts_filtered = starts_df[
-                (starts_df['move'] == train_id) & 
-                (starts_df['day'] == day_of_week)
-            ]
-            
-            if len(starts_filtered) > 0:
-                # Extract first equipment (locomotive) from equipment string
-                equipment_str = str(starts_filtered.iloc[0]['equipment'])
-                parts = equipment_str.split()
-                if len(parts) >= 1:
-                    try:
-                        lead_equipment = int(float(parts[0]))
-                        ptc_system = equipment_ptc.get(lead_equipment)
-                    except (ValueError, TypeError):
-                        pass
-        
-        results.append({
-            'date': delay['Date'],
-            'train_id': train_id,
-            'delay_cause': delay['DELAYCAUSE'],
-            'delay_minutes': delay['Delay (Minutes)'],
-            'lead_equipment': lead_equipment,
-            'ptc_system': ptc_system,
-            'engine_type': engine_type,
-            'day_of_week': day_of_week
-        })
-    
-    return pd.DataFrame(results)
-
-def analyze_results(results_df, equipment_ptc):
+    delays = pd.DataFrame({
+        'date': delay_timestamps(ptc_delays).values,
+        'train_id': normalize_train_ids(ptc_delays['TRAINID']).values,
+        'delay_cause': ptc_delays['DELAYCAUSE'].values,
+        'delay_minutes': ptc_delays['Delay (Minutes)'].values
+    })
+    # Location is carried through when the extract has it (older extracts do not)
+    if CHRONO_LOCATION_COLUMN in ptc_delays:
+        locations = ptc_delays[CHRONO_LOCATION_COLUMN]
+        delays['location'] = locations.astype(str).str.strip().where(locations.notna(), None).values
+    else:
+        delays['location'] = None
+    
+    # Service day (weekday or holiday) and its day code for every delay in one pass
+    delays['service_key'], delays['day_of_week'] = service_calendar(delays['date'])
+    
+    # First try to match from summary file (equipment that ran on the nearest service date)
+    summary_lead, engine_type, in_summary = lookup_summary_equipment(
+        summary_index, delays['train_id'], delays['date'], max_days=summary_max_days,
+        equipment_ptc=equipment_ptc
+    )
+    delays['summary_equipment'] = summary_lead
+    delays['engine_type'] = engine_type
+    
+    # Starts fallback: hash join on the prebuilt (move, service key) index, with each entry's
+    # PTC cab resolved once per distinct equipment string
+    starts_cab = resolve_cab_units(*consist_codes(starts_index['equipment']), equipment_ptc)
+    starts_lookup = pd.DataFrame({'starts_equipment': starts_cab, 'in_starts': True}, index=starts_index.index)
+    delays = delays.merge(starts_lookup, how='left', left_on=['train_id', 'service_key'], right_index=True)
+    in_starts = delays['in_starts'].notna().to_numpy()
+    
+    delays['lead_equipment'] = delays['summary_equipment'].where(in_summary, delays['starts_equipment'])
+    delays['lead_equipment'] = pd.to_numeric(delays['lead_equipment'], errors='coerce').astype(float)
+    
+    # Roster lookup is a direct index into the dense car-number array
+    system_codes = ptc_system_codes(equipment_ptc, delays['lead_equipment'])
+    delays['ptc_system'] = pd.Categorical.from_codes(system_codes - 1, categories=PTC_SYSTEMS[1:])
+    delays['engine_type'] = delays['engine_type'].where(in_summary, None)
+    
+    # Match quality from the masks above (summed over shards when matching in worker processes)
+    lead = delays['lead_equipment'].to_numpy()
+    missing = ~in_summary & ~in_starts
+    off_roster = ~np.isnan(lead) & (system_codes == 0)
+    quality.record('match', 'delays', len(delays))
+    quality.record('match', 'undated_delays', (delays['service_key'] < 0).sum())
+    quality.record('match', 'missing_from_all_sources', missing.sum(),
+                   delays.loc[missing, 'train_id'].value_counts().index)
+    quality.record('match', 'no_lead_unit', (~missing & np.isnan(lead)).sum())
+    quality.record('match', 'lead_not_on_roster', off_roster.sum(),
+                   pd.Series(lead[off_roster].astype(np.int64)).value_counts().index)
+    quality.record('match', 'matched', (system_codes > 0).sum())
+    
+    return compact_results(delays[RESULT_COLUMNS])
+
+def compact_results(results_df):
+    """Categoricals for repeated labels, nullable ints for counts/units, datetime64 dates"""
+    results_df = results_df.copy()
+    results_df['date'] = pd.to_datetime(results_df['date'], errors='coerce')
+    # Whole minutes become nullable ints; fractional minutes (e.g. 7.5) stay floats as the CHRONO had them
+    minutes = pd.to_numeric(results_df['delay_minutes'], errors='coerce')
+    known = minutes.dropna()
+    results_df['delay_minutes'] = minutes.astype('Int64' if (known == np.floor(known)).all() else 'Float64')
+    results_df['lead_equipment'] = pd.to_numeric(results_df['lead_equipment'], errors='coerce').astype('Int64')
+    results_df['ptc_system'] = pd.Categorical(results_df['ptc_system'], categories=PTC_SYSTEMS[1:])
+    results_df['day_of_week'] = pd.Categorical(results_df['day_of_week'], categories=SERVICE_DAY_LABELS)
+    # Free-text labels get sorted categories, so shards recombined here match a serial run
+    # (sorted as text, since a column can mix numbers and strings)
+    for col in ['delay_cause', 'engine_type', 'location']:
+        values = results_df[col].astype(object).where(results_df[col].notna(), None)
+        results_df[col] = pd.Categorical(values, categories=sorted(set(values.dropna()), key=str))
+    return results_df
+
+def fork_context():
+    """Process start method for pools over large read-only state
+
+    Fork shares the parent's state copy-on-write; spawn platforms pickle it once per worker
+    through the pool initializer instead of once per task.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('fork' if 'fork' in methods else None)
+
+# Read-only indexes seen by sharded match workers (inherited copy-on-write under fork)
+_worker_indexes = None
+
+def _init_match_worker(summary_index, starts_index, equipment_ptc):
+    global _worker_indexes
+    _worker_indexes = (summary_index, starts_index, equipment_ptc)
+
+def _match_shard(shard):
+    summary_index, starts_index, equipment_ptc = _worker_indexes
+    with contextlib.redirect_stdout(io.StringIO()):
+        results_df = match_delays_to_equipment(shard, summary_index, starts_index, equipment_ptc)
+    return results_df, quality.stage_checks('match')
+
+def shard_delays(ptc_delays, n_shards, by='date'):
+    """Row positions of each shard: contiguous service-date ranges or train ID hash buckets"""
+    if by == 'date':
+        days = pd.to_datetime(ptc_delays['Date'], errors='coerce').to_numpy(dtype='datetime64[D]')
+        order = np.argsort(days, kind='stable')
+        return [np.sort(part) for part in np.array_split(order, n_shards) if len(part)]
+    if by == 'train':
+        buckets = pd.util.hash_array(ptc_delays['TRAINID'].astype(str).to_numpy(dtype=object)) % n_shards
+        return [np.flatnonzero(buckets == shard) for shard in range(n_shards) if (buckets == shard).any()]
+    raise ValueError(f"Unknown shard key '{by}' (use 'date' or 'train')")
+
+def match_delays_sharded(ptc_delays, summary_index, starts_index, equipment_ptc, n_shards=None,
+                         by='date', workers=None):
+    """match_delays_to_equipment split into shards matched in worker processes; same output as serial"""
+    workers = workers or os.cpu_count() or 1
+    n_shards = n_shards or workers
+    positions = shard_delays(ptc_delays, n_shards, by=by)
+    print(f"Matching delays to equipment in {len(positions)} shard(s) by {by} on {workers} worker(s)...")
+    
+    shards = [ptc_delays.iloc[rows] for rows in positions]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=fork_context(), initializer=_init_match_worker,
+                             initargs=(summary_index, starts_index, equipment_ptc)) as pool:
+        shard_results = list(pool.map(_match_shard, shards))
+    
+    # Put every delay back at its original position so the frame equals a serial run
+    if not shard_results:
+        return match_delays_to_equipment(ptc_delays, summary_index, starts_index, equipment_ptc)
+    quality.merge('match', [checks for _, checks in shard_results])
+    results_df = pd.concat([result for result, _ in shard_results], ignore_index=True)
+    original_order = np.argsort(np.concatenate(positions), kind='stable')
+    return compact_results(results_df.iloc[original_order].reset_index(drop=True))
+
+def analyze_results(results_df, equipment_ptc, year=2024):
     """Analyze results and answer questions"""
+    return report_summary(build_delay_cube(results_df), equipment_ptc, year=year)
+
+def report_summary(cube, equipment_ptc, year=2024):
+    """Answer the questions from the delay cube (full run or results store)"""
     print("\n" + "="*50)
     print("ANALYSIS RESULTS")
     print("="*50)
     
-    # Filter to 2024 data
-    results_2024 = results_df[results_df['date'].dt.year == 2024].copy()
+    # Per-system totals for the requested year
+    by_system = rollup(cube[cube['year'] == year], ['ptc_system']).set_index('ptc_system')
     
     # Question 1: Expected reduction if all equipment switched to Siemens
-    alstom_delays = results_2024[results_2024['ptc_system'] == 'Alstom']
-    siemens_delays = results_2024[results_2024['ptc_system'] == 'Siemens']
+    alstom_delays = by_system.reindex(['Alstom'])
+    siemens_delays = by_system.reindex(['Siemens'])
     
     alstom_total_delay = alstom_delays['delay_minutes'].sum()
     siemens_total_delay = siemens_delays['delay_minutes'].sum()
     
-    alstom_count = len(alstom_delays)
-    siemens_count = len(siemens_delays)
+    alstom_count = int(alstom_delays['delays'].sum())
+    siemens_count = int(siemens_delays['delays'].sum())
     
+    expected_reduction = None
     if alstom_count > 0 and siemens_count > 0:
         alstom_avg_delay = alstom_total_delay / alstom_count
         siemens_avg_delay = siemens_total_delay / siemens_count
@@ -231,21 +694,22 @@ def analyze_results(results_df, equipment_ptc):
         print(f"   (Alstom avg: {alstom_avg_delay:.1f} min, Siemens avg: {siemens_avg_delay:.1f} min)")
     
     # Question 2 & 4: Equipment counts from PTC roster
-    alstom_equipment_count = sum(1 for ptc in equipment_ptc.values() if ptc == 'Alstom')
-    siemens_equipment_count = sum(1 for ptc in equipment_ptc.values() if ptc == 'Siemens')
+    fleet_counts = roster_counts(equipment_ptc)
+    alstom_equipment_count = fleet_counts['Alstom']
+    siemens_equipment_count = fleet_counts['Siemens']
     
     print(f"\n2. Pieces of fleet with Alstom PTC: {alstom_equipment_count}")
     print(f"   (From PTC Vehicle Roster)")
     
-    # Question 3: Alstom PTC delays in 2024
-    print(f"\n3. Alstom PTC delays in 2024: {len(alstom_delays)}")
+    # Question 3: Alstom PTC delays in the year
+    print(f"\n3. Alstom PTC delays in {year}: {alstom_count}")
     print(f"   Total delay time: {alstom_total_delay:.1f} minutes ({alstom_total_delay/60:.1f} hours)")
     
     print(f"\n4. Pieces of fleet with Siemens PTC: {siemens_equipment_count}")
     print(f"   (From PTC Vehicle Roster)")
     
-    # Question 5: Siemens PTC delays in 2024
-    print(f"\n5. Siemens PTC delays in 2024: {len(siemens_delays)}")
+    # Question 5: Siemens PTC delays in the year
+    print(f"\n5. Siemens PTC delays in {year}: {siemens_count}")
     print(f"   Total delay time: {siemens_total_delay:.1f} minutes ({siemens_total_delay/60:.1f} hours)")
     
     # Additional statistics
@@ -253,52 +717,152 @@ def analyze_results(results_df, equipment_ptc):
     print("ADDITIONAL STATISTICS")
     print("="*50)
     
-    print(f"Total PTC delays analyzed: {len(results_df)}")
-    print(f"Delays with identified equipment: {len(results_df[results_df['ptc_system'].notna()])}")
-    print(f"Delays without equipment match: {len(results_df[results_df['ptc_system'].isna()])}")
+    matched = cube['ptc_system'].notna()
+    print(f"Total PTC delays analyzed: {int(cube['delays'].sum())}")
+    print(f"Delays with identified equipment: {int(cube.loc[matched, 'delays'].sum())}")
+    print(f"Delays without equipment match: {int(cube.loc[~matched, 'delays'].sum())}")
     
     # Delay cause breakdown
     print(f"\nDelay cause breakdown:")
-    cause_counts = results_df['delay_cause'].value_counts()
+    cause_counts = cube.groupby('delay_cause')['delays'].sum().sort_values(ascending=False, kind='stable')
     for cause, count in cause_counts.items():
         print(f"  {cause}: {count}")
     
     return {
         'alstom_equipment_count': alstom_equipment_count,
         'siemens_equipment_count': siemens_equipment_count,
-        'alstom_delays_2024': len(alstom_delays),
-        'siemens_delays_2024': len(siemens_delays),
-        'expected_reduction': expected_reduction if 'expected_reduction' in locals() else None
+        'year': year,
+        'alstom_delays': alstom_count,
+        'siemens_delays': siemens_count,
+        'expected_reduction': expected_reduction
     }
 
-def main():
+def _roster_size(equipment_ptc):
+    return int(np.count_nonzero(equipment_ptc))
+
+def _summary_index_size(summary_index):
+    return len(summary_index['key'])
+
+def main(incremental=False, year=2024, metrics_path=None, profile_dir=None,
+         chrono_files=CHRONO_FILE, summary_files=SUMMARY_FILE, workers=None, shards=None, shard_by='date',
+         csv_path=None):
     """Main analysis function"""
     print("NJ TRANSIT PTC DELAY ANALYSIS - FINAL VERSION")
     print("="*50)
     
+    # Every stage is timed; --metrics writes the records, --profile-dir adds a cProfile dump per stage
+    instrumentation.reset()
+    instrumentation.configure(profile_dir)
+    quality.reset()
+    run_stage = instrumentation.run_stage
+    
     # Load data
-    chrono_df, starts_df, summary_df, ptc_roster = load_and_clean_data()
+    chrono_df, starts_df, summary_df, ptc_roster = run_stage(
+        'load_and_clean_data', load_and_clean_data, chrono_files=chrono_files, summary_files=summary_files,
+        workers=workers, rows_out=lambda loaded: sum(len(frame) for frame in loaded)
+    )
     
     # Filter PTC delays
-    ptc_delays = filter_ptc_delays(chrono_df)
-    
-    # Process PTC roster
-    equipment_ptc = process_ptc_roster(ptc_roster)
-    
-    # Extract equipment from summary file
-    summary_equipment = extract_equipment_from_summary(summary_df)
-    
-    # Match delays to equipment
-    results_df = match_delays_to_equipment(ptc_delays, summary_equipment, starts_df, equipment_ptc)
+    ptc_delays = run_stage('filter_ptc_delays', filter_ptc_delays, chrono_df, rows_in=len(chrono_df))
     
-    # Analyze results
-    analysis_results = analyze_results(results_df, equipment_ptc)
+    # In incremental mode only delays after the last run's high-water mark are matched
+    if incremental:
+        state = results_store.load_state()
+        ptc_delays = results_store.select_new_delays(ptc_delays, state)
+        print(f"New PTC delays since {state.get('last_date', 'start of history')}: {len(ptc_delays)}")
     
-    # Save results
-    results_df.to_csv('ptc_analysis_results_final.csv', index=False)
-    print(f"\nDetailed results saved to 'ptc_analysis_results_final.csv'")
+    # Process PTC roster
+    equipment_ptc = run_stage('process_ptc_roster', process_ptc_roster, ptc_roster,
+                              rows_in=len(ptc_roster), rows_out=_roster_size)
+    
+    # Index equipment from summary file by (consist, service date)
+    summary_index = run_stage('extract_equipment_from_summary', extract_equipment_from_summary, summary_df,
+                              rows_in=len(summary_df), rows_out=_summary_index_size)
+    
+    # Index starts file by (move, service day)
+    starts_index = run_stage('build_starts_index', build_starts_index, starts_df, rows_in=len(starts_df))
+    
+    # Match delays to equipment (optionally sharded across worker processes)
+    if shards and shards > 1:
+        results_df = run_stage('match_delays_to_equipment', match_delays_sharded,
+                               ptc_delays, summary_index, starts_index, equipment_ptc, n_shards=shards,
+                               by=shard_by, workers=workers, rows_in=len(ptc_delays))
+    else:
+        results_df = run_stage('match_delays_to_equipment', match_delays_to_equipment,
+                               ptc_delays, summary_index, starts_index, equipment_ptc, rows_in=len(ptc_delays))
+    
+    if incremental:
+        # Append to the month partitions and refresh only their aggregates
+        touched = results_store.append_results(results_df)
+        aggregates = results_store.refresh_aggregates(build_delay_cube, touched)
+        results_store.save_state(ptc_delays, state)
+        print(f"Appended {len(results_df)} delays to {len(touched)} partition(s) in '{results_store.RESULTS_STORE}'")
+        cube = aggregates.drop(columns=['partition_year', 'partition_month']) if aggregates is not None else None
+    else:
+        # Aggregate once; the report and the reporting scripts read the cube
+        cube = run_stage('build_delay_cube', build_delay_cube, results_df, rows_in=len(results_df))
+    
+    if cube is None:
+        print("Results store is empty, nothing to analyze")
+        analysis_results = None
+    else:
+        analysis_results = run_stage('analyze_results', report_summary, cube, equipment_ptc,
+                                     year=year, rows_in=len(cube), rows_out=None)
+        
+        # Save results: a full run rewrites the month partitions, so later incremental runs continue from it
+        if not incremental:
+            run_stage('write_results', results_store.write_results, results_df,
+                      rows_in=len(results_df), rows_out=None)
+            results_store.write_aggregates(results_store.partition_aggregates(cube))
+            results_store.save_state(ptc_delays, {})
+            print(f"\nDetailed results saved to '{results_store.RESULTS_STORE}' (partitioned by year/month)")
+            if csv_path:
+                results_store.write_results_csv(results_df, csv_path)
+                print(f"Detailed results also exported to '{csv_path}'")
+        write_cube(cube)
+        print(f"Delay cube saved to '{CUBE_FILE}'")
+        
+        # Per-unit exposure: summary service days against every stored delay (the whole store
+        # after an incremental run, whose results_df only holds the new delays)
+        exposure_delays = results_store.read_results(columns=ptc_exposure.EXPOSURE_COLUMNS) if incremental \
+            else results_df
+        exposure = run_stage('build_unit_exposure', ptc_exposure.build_unit_exposure, summary_df,
+                             exposure_delays, equipment_ptc, rows_in=len(summary_df))
+        ptc_exposure.write_exposure(exposure)
+        print(f"Unit exposure saved to '{ptc_exposure.EXPOSURE_FILE}'")
+    
+    # Counts recorded while parsing and matching (an incremental run's match counts cover its new delays)
+    quality.print_report()
+    quality.write_report(extra={'run': datetime.now().isoformat(timespec='seconds'), 'incremental': incremental})
+    print(f"Match-quality report saved to '{quality.QUALITY_FILE}'")
+    
+    if metrics_path:
+        instrumentation.print_metrics()
+        instrumentation.write_metrics(metrics_path, extra={'run': datetime.now().isoformat(timespec='seconds')})
+        print(f"Stage metrics saved to '{metrics_path}'")
     
     return analysis_results
 
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="NJ Transit PTC delay analysis")
+    parser.add_argument('--incremental', action='store_true',
+                        help="match only delays newer than the last run and append them to the results store")
+    parser.add_argument('--year', type=int, default=2024, help="year the questions are answered for")
+    parser.add_argument('--csv', nargs='?', const=RESULTS_CSV, default=None,
+                        help=f"also export every matched delay to one CSV (default name {RESULTS_CSV})")
+    parser.add_argument('--metrics', default=None,
+                        help="write per-stage wall/CPU time, peak RSS and row counts (.json or .csv)")
+    parser.add_argument('--profile-dir', default=None, help="dump a cProfile file per stage into this directory")
+    parser.add_argument('--chrono', nargs='+', default=[CHRONO_FILE], help="CHRONO extract files or glob patterns")
+    parser.add_argument('--summary', nargs='+', default=[SUMMARY_FILE], help="summary workbooks or glob patterns")
+    parser.add_argument('--workers', type=int, default=None, help="processes used to parse inputs and match shards")
+    parser.add_argument('--shards', type=int, default=None, help="split matching into this many shards")
+    parser.add_argument('--shard-by', choices=['date', 'train'], default='date',
+                        help="shard by service date range or by train ID hash")
+    args = parser.parse_args(argv)
+    main(incremental=args.incremental, year=args.year, metrics_path=args.metrics, profile_dir=args.profile_dir,
+         chrono_files=args.chrono, summary_files=args.summary, workers=args.workers,
+         shards=args.shards, shard_by=args.shard_by, csv_path=args.csv)
+
 if __name__ == "__main__":
-    main()
+    cli()
@@ -0,0 +1,136 @@
+import argparse
+import numpy as np
+import pandas as pd
+import ptc_delay_analysis_final as ptc
+import ptc_results_store as results_store
+from ptc_parsing import whole_numbers, service_days, summary_keys
+
+# Per-unit exposure table written next to the delay cube and read by the reporting scripts
+EXPOSURE_FILE = 'ptc_unit_exposure.csv'
+
+# Car series are blocks of unit numbers (4600-4699 -> 4600)
+SERIES_BLOCK = 100
+
+# Delay rates are quoted per this many unit-service-days
+RATE_DAYS = 1000
+
+EXPOSURE_COLUMNS = ['date', 'delay_minutes', 'lead_equipment']
+
+
+def unit_service_days(summary_df):
+    """Service days and consists (train runs) per unit, over every unit each summary row lists
+
+    Equipment cells are parsed once per distinct string; each dated row is then expanded to one
+    (unit, day, run) triple per listed unit and a single groupby counts the distinct days and runs.
+    """
+    consist = whole_numbers(summary_df.iloc[:, ptc.SUMMARY_CONSIST_COL])
+    days, undated = service_days(summary_df.iloc[:, ptc.SUMMARY_DATE_COL])
+    codes, consists = ptc.consist_codes(summary_df.iloc[:, ptc.SUMMARY_EQUIPMENT_COL])
+
+    lengths = np.fromiter((len(units) for units in consists), dtype=np.int64, count=len(consists))
+    flat = np.fromiter((unit for units in consists for unit in units), dtype=np.int64, count=int(lengths.sum()))
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+
+    rows = np.flatnonzero((codes >= 0) & ~undated & ~np.isnan(consist) & (consist >= 0))
+    rows = rows[lengths[codes[rows]] > 0]
+    per_row = lengths[codes[rows]]
+    row_of = np.repeat(rows, per_row)
+    # Position of each expanded entry inside its row's consist
+    within = np.arange(len(row_of)) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+
+    entries = pd.DataFrame({
+        'unit': flat[offsets[codes[row_of]] + within],
+        'day': days[row_of],
+        'run': summary_keys(consist[row_of], days[row_of])
+    })
+    exposure = entries.groupby('unit', sort=True).agg(service_days=('day', 'nunique'), consists=('run', 'nunique'))
+    first_day = int(days[rows].min()) if len(rows) else None
+    last_day = int(days[rows].max()) if len(rows) else None
+    return exposure, (first_day, last_day)
+
+
+def build_unit_exposure(summary_df, results_df, equipment_ptc):
+    """Per unit: PTC system, series, service days, consists, matched delays and delays per 1,000 days
+
+    Every roster unit gets a row (with zero exposure if it never ran in the summary), as does
+    every unit that ran or led a delay. Delays count only when they fall inside the summary's
+    date range, so the rate compares delays and exposure over the same days.
+    """
+    exposure, (first_day, last_day) = unit_service_days(summary_df)
+
+    delay_days, undated = service_days(results_df['date'])
+    lead = pd.to_numeric(results_df['lead_equipment'], errors='coerce').to_numpy(dtype=float)
+    in_range = ~undated & ~np.isnan(lead)
+    if first_day is not None:
+        in_range &= (delay_days >= first_day) & (delay_days <= last_day)
+    delays = pd.DataFrame({
+        'unit': lead[in_range].astype(np.int64),
+        'delay_minutes': pd.to_numeric(results_df['delay_minutes'], errors='coerce').to_numpy(dtype=float)[in_range]
+    }).groupby('unit', sort=True).agg(delays=('delay_minutes', 'size'), delay_minutes=('delay_minutes', 'sum'))
+
+    units = np.union1d(np.union1d(np.flatnonzero(equipment_ptc > 0), exposure.index), delays.index)
+    table = pd.DataFrame({'unit': units})
+    table['series'] = units // SERIES_BLOCK * SERIES_BLOCK
+    table['ptc_system'] = ptc.PTC_SYSTEMS[ptc.ptc_system_codes(equipment_ptc, units)]
+    table['service_days'] = exposure['service_days'].reindex(units, fill_value=0).to_numpy()
+    table['consists'] = exposure['consists'].reindex(units, fill_value=0).to_numpy()
+    table['delays'] = delays['delays'].reindex(units, fill_value=0).to_numpy()
+    table['delay_minutes'] = delays['delay_minutes'].reindex(units, fill_value=0.0).to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        table['delays_per_1000_days'] = np.where(table['service_days'] > 0,
+                                                 table['delays'] * RATE_DAYS / table['service_days'], np.nan)
+    return table
+
+
+def exposure_rates(exposure, by):
+    """Units, active units, unit-service-days, delays and delays per 1,000 days over coarser groups"""
+    exposure = exposure.assign(active=exposure['service_days'] > 0)
+    totals = exposure.groupby(by, dropna=False, sort=True).agg(
+        units=('unit', 'size'), active_units=('active', 'sum'), service_days=('service_days', 'sum'),
+        consists=('consists', 'sum'), delays=('delays', 'sum'), delay_minutes=('delay_minutes', 'sum')
+    )
+    with np.errstate(invalid='ignore', divide='ignore'):
+        totals['delays_per_1000_days'] = totals['delays'] * RATE_DAYS / totals['service_days'].where(
+            totals['service_days'] > 0)
+    return totals.reset_index()
+
+
+def write_exposure(exposure, path=EXPOSURE_FILE):
+    """Save the exposure table (one row per unit)"""
+    exposure.to_csv(path, index=False)
+    return path
+
+
+def read_exposure(path=EXPOSURE_FILE):
+    """Load the exposure table"""
+    return pd.read_csv(path)
+
+
+def main(summary_files=None, roster_file=None, store=results_store.RESULTS_STORE, output=EXPOSURE_FILE):
+    summary_df = ptc.load_input('summary', summary_files or ptc.SUMMARY_FILE)
+    roster = ptc.load_input('roster', roster_file or ptc.ROSTER_FILE)
+    results_df = results_store.require_results(store, columns=EXPOSURE_COLUMNS)
+
+    exposure = build_unit_exposure(summary_df, results_df, ptc.process_ptc_roster(roster))
+    write_exposure(exposure, output)
+    print(f"Unit exposure for {len(exposure)} units saved to '{output}'")
+    print(f"\nDelays per {RATE_DAYS:,} unit-service-days by PTC system:")
+    print(exposure_rates(exposure, ['ptc_system']).to_string(index=False, float_format='%.2f'))
+    print(f"\nDelays per {RATE_DAYS:,} unit-service-days by roster series:")
+    on_roster = exposure[exposure['ptc_system'].notna()]
+    print(exposure_rates(on_roster, ['ptc_system', 'series']).to_string(index=False, float_format='%.2f'))
+    return exposure
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Per-unit service days and delays per 1,000 unit-service-days")
+    parser.add_argument('--summary', nargs='+', default=None, help="summary workbooks or glob patterns")
+    parser.add_argument('--roster', default=None, help="PTC vehicle roster workbook")
+    parser.add_argument('--store', default=results_store.RESULTS_STORE)
+    parser.add_argument('--output', default=EXPOSURE_FILE)
+    args = parser.parse_args(argv)
+    main(summary_files=args.summary, roster_file=args.roster, store=args.store, output=args.output)
+
+
+if __name__ == "__main__":
+    cli()
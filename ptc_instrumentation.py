@@ -0,0 +1,149 @@
+import os
+import sys
+import csv
+import json
+import time
+import cProfile
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Per-stage records of the current process, in the order the stages ran
+_records = []
+_profile_dir = None
+
+METRIC_FIELDS = ['stage', 'wall_seconds', 'cpu_seconds', 'child_cpu_seconds', 'peak_rss_mb',
+                 'process_peak_rss_mb', 'rows_in', 'rows_out', 'rows_per_second', 'profile']
+
+# Linux lets a process reset its RSS high-water mark (VmHWM), which gives a peak per stage
+CLEAR_REFS = '/proc/self/clear_refs'
+STATUS = '/proc/self/status'
+
+
+def configure(profile_dir=None):
+    """Turn per-stage cProfile dumps on (a directory) or off (None)"""
+    global _profile_dir
+    _profile_dir = profile_dir
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+
+def reset():
+    """Forget the stages recorded so far"""
+    _records.clear()
+
+
+def records():
+    """Stage records collected so far"""
+    return list(_records)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None where unsupported)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return round(peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def reset_peak_rss():
+    """Restart the RSS high-water mark so the next stage_peak_rss_mb covers one stage only"""
+    try:
+        with open(CLEAR_REFS, 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def stage_peak_rss_mb():
+    """RSS high-water mark since reset_peak_rss, in MB (None where unsupported)"""
+    try:
+        with open(STATUS) as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def child_cpu_seconds():
+    """User + system CPU of the finished worker processes of this process (0 where unsupported)"""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_stage(name, func, *args, rows_in=None, rows_out=len, **kwargs):
+    """Call func(*args, **kwargs) and record wall/CPU time, peak RSS and row counts for it
+
+    CPU time of worker processes the stage started (and joined) is recorded separately from
+    this process's own. The peak RSS is this process's over the stage where the high-water mark
+    can be reset (Linux), else None; process_peak_rss_mb is the whole run's peak so far.
+    """
+    profiler = cProfile.Profile() if _profile_dir else None
+    stage_peak = reset_peak_rss()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    child_start = child_cpu_seconds()
+    if profiler:
+        profiler.enable()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        if profiler:
+            profiler.disable()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    child_cpu = child_cpu_seconds() - child_start
+
+    n_out = int(rows_out(result)) if rows_out is not None and result is not None else None
+    throughput = rows_in if rows_in is not None else n_out
+    record = {
+        'stage': name,
+        'wall_seconds': round(wall, 6),
+        'cpu_seconds': round(cpu, 6),
+        'child_cpu_seconds': round(child_cpu, 6),
+        'peak_rss_mb': stage_peak_rss_mb() if stage_peak else None,
+        'process_peak_rss_mb': peak_rss_mb(),
+        'rows_in': rows_in,
+        'rows_out': n_out,
+        'rows_per_second': round(throughput / wall, 1) if throughput and wall > 0 else None,
+        'profile': None
+    }
+    if profiler:
+        record['profile'] = os.path.join(_profile_dir, f"{len(_records):02d}_{name}.prof")
+        profiler.dump_stats(record['profile'])
+    _records.append(record)
+    return result
+
+
+def write_metrics(path, extra=None):
+    """Write the stage records as JSON (.json) or CSV (anything else)"""
+    rows = [dict(extra or {}, **record) for record in _records]
+    if path.endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump(rows, f, indent=2)
+    else:
+        fields = list(extra or {}) + METRIC_FIELDS
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+    return path
+
+
+def print_metrics():
+    """One line per stage for the console"""
+    print(f"\n{'Stage':<32} {'Wall (s)':>10} {'CPU (s)':>10} {'Workers (s)':>12} {'Stage peak RSS (MB)':>20} "
+          f"{'Rows in':>10} {'Rows out':>10}")
+    for record in _records:
+        print(f"{record['stage']:<32} {record['wall_seconds']:>10.3f} {record['cpu_seconds']:>10.3f} "
+              f"{record['child_cpu_seconds']:>12.3f} {record['peak_rss_mb'] if record['peak_rss_mb'] is not None else '-':>20} "
+              f"{record['rows_in'] if record['rows_in'] is not None else '-':>10} "
+              f"{record['rows_out'] if record['rows_out'] is not None else '-':>10}")
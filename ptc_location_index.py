@@ -0,0 +1,149 @@
+import argparse
+import numpy as np
+import pandas as pd
+import ptc_results_store as results_store
+
+# Systems counted per location (index 0 = delays without an identified PTC system)
+INDEX_SYSTEMS = ['Unmatched', 'Alstom', 'Siemens']
+LOCATION_COLUMNS = ['date', 'delay_minutes', 'ptc_system', 'location']
+
+
+def build_location_index(results_df):
+    """CSR index of delays by location: each location owns one date-sorted slice of row offsets
+
+    Delays are ordered by (location, date) once, with running delay / minute totals per PTC
+    system along that order. Any location and date window is then two searchsorted calls and a
+    difference of running totals; no query scans the delays.
+    """
+    locations = pd.Categorical(results_df['location'])
+    codes = locations.codes.astype(np.int64)
+    days = pd.to_datetime(results_df['date'], errors='coerce').to_numpy(dtype='datetime64[D]')
+    # Undated delays sort last within their location
+    day_numbers = np.where(np.isnat(days), np.iinfo(np.int64).max, days.astype(np.int64))
+
+    rows = np.flatnonzero(codes >= 0)
+    rows = rows[np.lexsort((day_numbers[rows], codes[rows]))]
+    counts = np.bincount(codes[rows], minlength=len(locations.categories))
+
+    systems = pd.Categorical(results_df['ptc_system'], categories=INDEX_SYSTEMS[1:]).codes[rows] + 1
+    minutes = pd.to_numeric(results_df['delay_minutes'], errors='coerce').to_numpy(dtype=float)[rows]
+    minutes = np.where(np.isnan(minutes), 0.0, minutes)
+    in_system = systems[None, :] == np.arange(len(INDEX_SYSTEMS))[:, None]
+    zeros = np.zeros((len(INDEX_SYSTEMS), 1))
+    return {
+        'locations': np.asarray(locations.categories, dtype=object),
+        'codes': {location: code for code, location in enumerate(locations.categories)},
+        'offsets': np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+        'rows': rows,
+        'days': day_numbers[rows],
+        'cum_delays': np.hstack([zeros, np.cumsum(in_system, axis=1)]).astype(np.int64),
+        'cum_minutes': np.hstack([zeros, np.cumsum(in_system * minutes, axis=1)])
+    }
+
+
+def _location_codes(index, locations):
+    missing = [location for location in locations if location not in index['codes']]
+    if missing:
+        raise KeyError(f"Unknown location(s): {missing}")
+    return np.array([index['codes'][location] for location in locations], dtype=np.int64)
+
+
+def _day_number(value):
+    return np.datetime64(pd.Timestamp(value), 'D').astype(np.int64)
+
+
+def _windows(index, codes, start=None, end=None):
+    """Offset bounds of each location's delays with start <= date < end"""
+    lo = index['offsets'][codes].copy()
+    hi = index['offsets'][codes + 1].copy()
+    for i, code in enumerate(codes):
+        days = index['days'][lo[i]:hi[i]]
+        first = index['offsets'][code]
+        if start is not None:
+            lo[i] = first + np.searchsorted(days, _day_number(start))
+        if end is not None:
+            hi[i] = first + np.searchsorted(days, _day_number(end))
+    return lo, np.maximum(hi, lo)
+
+
+def _totals(index, codes, start=None, end=None):
+    """(delays, minutes) arrays shaped (locations, systems) from the running totals"""
+    lo, hi = _windows(index, codes, start, end)
+    delays = (index['cum_delays'][:, hi] - index['cum_delays'][:, lo]).T
+    minutes = (index['cum_minutes'][:, hi] - index['cum_minutes'][:, lo]).T
+    return delays, minutes
+
+
+def location_stats(index, locations, start=None, end=None):
+    """Delays and minutes per PTC system for each location"""
+    if isinstance(locations, str):
+        locations = [locations]
+    delays, minutes = _totals(index, _location_codes(index, locations), start, end)
+    return pd.DataFrame({
+        'location': np.repeat(np.asarray(locations, dtype=object), len(INDEX_SYSTEMS)),
+        'ptc_system': INDEX_SYSTEMS * len(locations),
+        'delays': delays.ravel(),
+        'delay_minutes': minutes.ravel()
+    })
+
+
+def segment_stats(index, locations, start=None, end=None):
+    """Totals per PTC system over a segment (the listed locations together)"""
+    delays, minutes = _totals(index, _location_codes(index, locations), start, end)
+    delays, minutes = delays.sum(axis=0), minutes.sum(axis=0)
+    return pd.DataFrame({
+        'ptc_system': INDEX_SYSTEMS,
+        'delays': delays,
+        'delay_minutes': minutes,
+        'mean_minutes': minutes / np.where(delays > 0, delays, np.nan)
+    })
+
+
+def hot_spots(index, ptc_system='Alstom', n=10, by='delays', start=None, end=None):
+    """Top-n locations for one PTC system by delay count or delay minutes"""
+    system = INDEX_SYSTEMS.index(ptc_system)
+    delays, minutes = _totals(index, np.arange(len(index['locations'])), start, end)
+    delays, minutes = delays[:, system], minutes[:, system]
+    score = delays if by == 'delays' else minutes
+
+    top = np.argsort(-score, kind='stable')[:n]
+    top = top[score[top] > 0]
+    return pd.DataFrame({
+        'location': index['locations'][top],
+        'ptc_system': ptc_system,
+        'delays': delays[top],
+        'delay_minutes': minutes[top],
+        'mean_minutes': minutes[top] / delays[top]
+    })
+
+
+def load_location_index(store=results_store.RESULTS_STORE, years=None):
+    """Location index over the results store (selected years only)"""
+    results_df = results_store.require_results(store, years=years, columns=LOCATION_COLUMNS)
+    return build_location_index(results_df)
+
+
+def main(years=None, top=10, by='delays', locations=None, store=results_store.RESULTS_STORE):
+    index = load_location_index(store, years)
+    print(f"Location index: {len(index['rows'])} delays at {len(index['locations'])} locations")
+    for system in INDEX_SYSTEMS[1:]:
+        print(f"\nTop {top} {system} PTC hot spots by {by}:")
+        print(hot_spots(index, system, n=top, by=by).to_string(index=False, float_format='%.1f'))
+    if locations:
+        print(f"\nSegment {', '.join(locations)}:")
+        print(segment_stats(index, locations).to_string(index=False, float_format='%.1f'))
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="PTC delay hot spots and per-location / segment totals")
+    parser.add_argument('--years', type=int, nargs='*', default=None, help="years to index (default: all)")
+    parser.add_argument('--top', type=int, default=10, help="hot spots listed per PTC system")
+    parser.add_argument('--by', choices=['delays', 'minutes'], default='delays')
+    parser.add_argument('--segment', nargs='+', default=None, help="locations to total together")
+    parser.add_argument('--store', default=results_store.RESULTS_STORE)
+    args = parser.parse_args(argv)
+    main(years=args.years, top=args.top, by=args.by, locations=args.segment, store=args.store)
+
+
+if __name__ == "__main__":
+    cli()
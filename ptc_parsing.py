@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+# Cell parsing shared by the analysis, the results store and the reporting modules. This module
+# imports nothing from the others, so any of them can import it at the top.
+
+# Index keys pack (consist, service day) into one sortable int64
+DAY_BITS = 20
+DAY_OFFSET = 1 << (DAY_BITS - 1)
+# Undated delays query at the largest encodable day, so the as-of lookup lands on the latest entry
+UNDATED_QUERY_DAY = (1 << DAY_BITS) - 1
+
+
+def whole_numbers(values):
+    """Vectorized int(float(x)): NaN where the value is missing or not a finite number"""
+    values = pd.Series(values)
+    if values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+        values = values.astype(str).str.strip()
+    numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float, copy=True)
+    numbers[~np.isfinite(numbers)] = np.nan
+    return np.trunc(numbers)
+
+
+def normalize_train_ids(values):
+    """Canonical train ID text: trimmed, upper case, no float suffix or leading zeros ("0612.0" -> "612")"""
+    values = pd.Series(values)
+    text = values.astype(str).str.strip().str.upper().str.replace(r'\.0+$', '', regex=True)
+    digits = text.str.fullmatch(r'\d+')
+    text = text.where(~digits, text.str.lstrip('0').replace('', '0'))
+    return text.where(values.notna(), None)
+
+
+def service_days(dates):
+    """Days since 1970-01-01 as int64; missing dates come back as -1 with a mask"""
+    days = pd.to_datetime(pd.Series(dates), errors='coerce').to_numpy(dtype='datetime64[D]', copy=True)
+    missing = np.isnat(days)
+    return np.where(missing, -1, days.astype(np.int64)), missing
+
+
+def summary_keys(consist, days):
+    return (consist.astype(np.int64) << DAY_BITS) | (days + DAY_OFFSET)
+
+
+def parquet_available():
+    """Parquet files (cache and results store) need pyarrow"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
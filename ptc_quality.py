@@ -0,0 +1,63 @@
+import json
+
+# Data-quality counts recorded by the parse and match stages from masks they already compute,
+# so the report needs no second scan of the inputs
+QUALITY_FILE = 'ptc_match_quality.json'
+
+# Offending values kept per check (the most frequent first where a stage ranks them)
+MAX_EXAMPLES = 10
+
+# stage -> {check: count} and stage -> {check: [example values]} of the current process
+_checks = {}
+_examples = {}
+
+
+def reset():
+    """Forget the checks recorded so far"""
+    _checks.clear()
+    _examples.clear()
+
+
+def record(stage, check, count, examples=None):
+    """Set one check's count (a re-run of the stage replaces it), with a few offending values"""
+    _checks.setdefault(stage, {})[check] = int(count)
+    if examples is not None:
+        _examples.setdefault(stage, {})[check] = [str(value) for value in list(examples)[:MAX_EXAMPLES]]
+
+
+def stage_checks(stage):
+    """(counts, examples) of one stage, e.g. to send back from a worker process"""
+    return dict(_checks.get(stage, {})), {check: list(values) for check, values in _examples.get(stage, {}).items()}
+
+
+def merge(stage, parts):
+    """Sum the counts of one stage recorded in several processes (examples are concatenated)"""
+    _checks[stage] = {}
+    _examples[stage] = {}
+    for counts, examples in parts:
+        for check, count in counts.items():
+            _checks[stage][check] = _checks[stage].get(check, 0) + count
+        for check, values in examples.items():
+            merged = _examples[stage].setdefault(check, [])
+            merged.extend(value for value in values if value not in merged)
+            del merged[MAX_EXAMPLES:]
+
+
+def report():
+    """Every recorded check as {stage: {check: count}} plus examples"""
+    return {'checks': {stage: dict(counts) for stage, counts in _checks.items()},
+            'examples': {stage: {check: list(values) for check, values in examples.items()}
+                         for stage, examples in _examples.items() if examples}}
+
+
+def print_report():
+    print("\nData quality:")
+    for stage, counts in _checks.items():
+        print(f"  {stage}: " + ', '.join(f"{check}={count}" for check, count in counts.items()))
+
+
+def write_report(path=QUALITY_FILE, extra=None):
+    """Save the checks as one compact JSON document"""
+    with open(path, 'w') as f:
+        json.dump({**(extra or {}), **report()}, f, indent=1)
+    return path
@@ -0,0 +1,287 @@
+import os
+import json
+import glob
+import shutil
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from ptc_parsing import normalize_train_ids, parquet_available
+
+# Matched results partitioned by delay month (Parquet part files), plus run state and per-partition aggregates
+RESULTS_STORE = 'ptc_results'
+STATE_FILE = '_state.json'
+AGGREGATES_FILE = '_aggregates.csv'
+
+# Partition for delays without a usable date
+UNDATED = (0, 0)
+
+
+def partition_path(store, year, month):
+    """Directory holding the part files of one year/month"""
+    return os.path.join(store, f"year={year:04d}", f"month={month:02d}")
+
+
+def _partition_keys(dates):
+    """(year, month) per row; undated rows go to the UNDATED partition"""
+    dates = pd.to_datetime(dates, errors='coerce')
+    years = dates.dt.year.fillna(UNDATED[0]).astype(int)
+    months = dates.dt.month.fillna(UNDATED[1]).astype(int)
+    return years, months
+
+
+def load_state(store=RESULTS_STORE):
+    """High-water mark of the last incremental run ({} if the store is new)"""
+    path = os.path.join(store, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _train_ids(values):
+    """Normalized train IDs as the high-water mark stores them ('' for a missing ID)"""
+    return normalize_train_ids(values).fillna('')
+
+
+def _text(values):
+    """Trimmed label text ('' for a missing label)"""
+    values = pd.Series(values).reset_index(drop=True).astype(object)
+    return values.where(values.isna(), values.astype(str).str.strip()).fillna('')
+
+
+def _row_keys(dates, train_ids, causes, minutes, locations):
+    """One hash per delay over (service day, train, cause, minutes, location), as decimal text"""
+    rows = pd.DataFrame({
+        'day': pd.to_datetime(pd.Series(dates), errors='coerce').dt.normalize().reset_index(drop=True),
+        'train': _train_ids(train_ids).reset_index(drop=True),
+        'cause': _text(causes),
+        'minutes': pd.to_numeric(pd.Series(minutes), errors='coerce').astype(float).reset_index(drop=True),
+        'location': _text(locations)
+    })
+    return pd.util.hash_pandas_object(rows, index=False).astype(str).reset_index(drop=True)
+
+
+def _delay_keys(ptc_delays):
+    """Row keys of CHRONO delays (extracts without a Location column key on an empty location)"""
+    locations = ptc_delays['Location'] if 'Location' in ptc_delays else [None] * len(ptc_delays)
+    return _row_keys(ptc_delays['Date'], ptc_delays['TRAINID'], ptc_delays['DELAYCAUSE'],
+                     ptc_delays['Delay (Minutes)'], locations)
+
+
+def _unseen(keys, seen_counts):
+    """True for each row beyond the number of times its key was already seen (repeats are kept)"""
+    occurrence = keys.groupby(keys).cumcount()
+    return (occurrence >= keys.map(seen_counts).fillna(0)).to_numpy()
+
+
+def save_state(ptc_delays, state, store=RESULTS_STORE):
+    """Advance the high-water mark past the delays just processed"""
+    dates = pd.to_datetime(ptc_delays['Date'], errors='coerce')
+    new_state = {key: value for key, value in state.items() if key != 'last_date_train_ids'}
+    if dates.notna().any():
+        last_date = dates.max().normalize()
+        counts = _delay_keys(ptc_delays)[(dates.dt.normalize() == last_date).to_numpy()].value_counts()
+        if state.get('last_date') == last_date.strftime('%Y-%m-%d'):
+            counts = counts.add(pd.Series(state.get('last_date_rows', {}), dtype='int64'), fill_value=0)
+        new_state['last_date'] = last_date.strftime('%Y-%m-%d')
+        new_state['last_date_rows'] = {key: int(count) for key, count in sorted(counts.items())}
+    new_state['delays_processed'] = state.get('delays_processed', 0) + len(ptc_delays)
+    new_state['updated'] = datetime.now().isoformat(timespec='seconds')
+
+    os.makedirs(store, exist_ok=True)
+    tmp_path = os.path.join(store, STATE_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(new_state, f, indent=2)
+    os.replace(tmp_path, os.path.join(store, STATE_FILE))
+    return new_state
+
+
+def _undated_counts(store):
+    """How many times each row key is already in the undated partition"""
+    if UNDATED not in list_partitions(store):
+        return pd.Series(dtype='int64')
+    stored = read_partition(store, *UNDATED)
+    locations = stored['location'] if 'location' in stored else [None] * len(stored)
+    return _row_keys(stored['date'], stored['train_id'], stored['delay_cause'], stored['delay_minutes'],
+                     locations).value_counts()
+
+
+def select_new_delays(ptc_delays, state, store=RESULTS_STORE):
+    """PTC delays after the high-water mark, plus undated delays not yet in the store
+
+    Delays on the last processed day count as seen by their row key (day, train, cause, minutes,
+    location), so a later delay of an already-seen train on that day is still picked up. Delays
+    without a usable date are compared against the undated partition instead.
+    """
+    days = pd.to_datetime(ptc_delays['Date'], errors='coerce').dt.normalize()
+    undated = days.isna().to_numpy()
+    keys = _delay_keys(ptc_delays)
+    new = np.zeros(len(ptc_delays), dtype=bool)
+    if undated.any():
+        new[undated] = _unseen(keys[undated].reset_index(drop=True), _undated_counts(store))
+
+    if not state.get('last_date'):
+        return ptc_delays[new | ~undated]
+    last_date = pd.Timestamp(state['last_date'])
+    same_day = (days == last_date).to_numpy()
+    if 'last_date_rows' in state:
+        new[same_day] = _unseen(keys[same_day].reset_index(drop=True), state['last_date_rows'])
+    else:
+        # State written before row keys: the boundary day is keyed on train ID only
+        seen_ids = set(_train_ids(state.get('last_date_train_ids', [])))
+        new[same_day] = ~_train_ids(ptc_delays['TRAINID'][same_day]).isin(seen_ids).to_numpy()
+    return ptc_delays[new | (days > last_date).to_numpy()]
+
+
+def csv_frame(results_df):
+    """Results as the CSV has always been written (lead unit as float, e.g. 4631.0)"""
+    csv_df = results_df.copy()
+    csv_df['lead_equipment'] = csv_df['lead_equipment'].astype('float64')
+    if csv_df['delay_minutes'].isna().any():
+        csv_df['delay_minutes'] = csv_df['delay_minutes'].astype('float64')
+    return csv_df
+
+
+def write_results_csv(results_df, path, **to_csv_kwargs):
+    """Write matched results to CSV in the established format"""
+    csv_frame(results_df).to_csv(path, index=False, **to_csv_kwargs)
+    return path
+
+
+def _write_part(part, directory):
+    """Add one part file to a partition directory (Parquet keeps the dtypes; CSV only without pyarrow)"""
+    os.makedirs(directory, exist_ok=True)
+    n_parts = len(glob.glob(os.path.join(directory, 'part-*')))
+    if parquet_available():
+        path = os.path.join(directory, f"part-{n_parts:05d}.parquet")
+        tmp_path = path + '.tmp'
+        part.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    else:
+        path = os.path.join(directory, f"part-{n_parts:05d}.csv")
+        write_results_csv(part, path)
+    return path
+
+
+def append_results(results_df, store=RESULTS_STORE):
+    """Append matched delays to their month partitions; returns the partitions touched"""
+    years, months = _partition_keys(results_df['date'])
+    touched = []
+    for (year, month), part in results_df.groupby([years, months], sort=True):
+        _write_part(part, partition_path(store, year, month))
+        touched.append((int(year), int(month)))
+    return touched
+
+
+def write_results(results_df, store=RESULTS_STORE):
+    """Replace every partition of the store with the results of a full run"""
+    for stale in glob.glob(os.path.join(store, 'year=*')):
+        if os.path.isdir(stale):
+            shutil.rmtree(stale)
+        else:
+            os.remove(stale)
+    return append_results(results_df, store)
+
+
+def _read_part(path, columns=None):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    parse_dates = ['date'] if columns is None or 'date' in columns else False
+    return pd.read_csv(path, usecols=columns, parse_dates=parse_dates)
+
+
+def _concat_parts(frames):
+    """Concatenate part files, keeping categoricals whose categories differ between parts"""
+    results_df = pd.concat(frames, ignore_index=True)
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype) and results_df[col].dtype == object:
+            categories = sorted(set(results_df[col].dropna()), key=str)
+            results_df[col] = pd.Categorical(results_df[col], categories=categories)
+    return results_df
+
+
+def read_partition(store, year, month, columns=None):
+    """Matched delays of one partition"""
+    parts = sorted(glob.glob(os.path.join(partition_path(store, year, month), 'part-*')))
+    parts = [path for path in parts if not path.endswith('.tmp')]
+    return _concat_parts([_read_part(path, columns) for path in parts])
+
+
+def list_partitions(store=RESULTS_STORE):
+    """All (year, month) partitions present in the store"""
+    partitions = []
+    for path in glob.glob(os.path.join(store, 'year=*', 'month=*')):
+        if not os.path.isdir(path):
+            continue
+        year = int(os.path.basename(os.path.dirname(path)).split('=')[1])
+        month = int(os.path.basename(path).split('=')[1])
+        partitions.append((year, month))
+    return sorted(partitions)
+
+
+def read_results(store=RESULTS_STORE, years=None, months=None, columns=None):
+    """Matched delays of the selected years/months only, reading just the requested columns"""
+    selected = [
+        (year, month) for year, month in list_partitions(store)
+        if (years is None or year in years) and (months is None or month in months)
+    ]
+    if not selected:
+        return None
+    return _concat_parts([read_partition(store, year, month, columns) for year, month in selected])
+
+
+def require_results(store=RESULTS_STORE, years=None, months=None, columns=None):
+    """read_results for the reporting CLIs: a store without the selected partitions is an error"""
+    results_df = read_results(store, years=years, months=months, columns=columns)
+    if results_df is None:
+        selected = f" for {', '.join(str(year) for year in years)}" if years else ''
+        raise FileNotFoundError(f"No partitions{selected} in '{store}'; run the analysis first")
+    return results_df
+
+
+def read_aggregates(store=RESULTS_STORE):
+    """Per-partition aggregates kept next to the partitions"""
+    path = os.path.join(store, AGGREGATES_FILE)
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path)
+
+
+def refresh_aggregates(summarize, touched, store=RESULTS_STORE):
+    """Recompute aggregates for the touched partitions only and merge them into the stored ones"""
+    aggregates = read_aggregates(store)
+    if not touched:
+        return aggregates
+
+    fresh = [
+        summarize(read_partition(store, year, month)).assign(partition_year=year, partition_month=month)
+        for year, month in touched
+    ]
+    fresh = pd.concat(fresh, ignore_index=True)
+
+    if aggregates is not None:
+        stale = pd.MultiIndex.from_frame(aggregates[['partition_year', 'partition_month']])
+        aggregates = aggregates[~stale.isin(touched)]
+
+    if aggregates is not None:
+        fresh = pd.concat([aggregates, fresh], ignore_index=True)
+    aggregates = fresh.sort_values(['partition_year', 'partition_month'], kind='stable')
+
+    return write_aggregates(aggregates, store)
+
+
+def write_aggregates(aggregates, store=RESULTS_STORE):
+    """Replace the stored per-partition aggregates"""
+    os.makedirs(store, exist_ok=True)
+    tmp_path = os.path.join(store, AGGREGATES_FILE + '.tmp')
+    aggregates.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, os.path.join(store, AGGREGATES_FILE))
+    return aggregates
+
+
+def partition_aggregates(cube):
+    """Per-partition aggregates from a cube of the whole store (undated cells go to UNDATED)"""
+    return cube.assign(
+        partition_year=cube['year'].fillna(UNDATED[0]).astype(int),
+        partition_month=cube['month'].fillna(UNDATED[1]).astype(int)
+    )
@@ -0,0 +1,197 @@
+import math
+import argparse
+import numpy as np
+import pandas as pd
+import ptc_results_store as results_store
+
+# Trailing windows evaluated at every delay (pandas offset aliases)
+WINDOWS = ['15min', '1h', '1D', '7D']
+GROUP_COLUMNS = ['ptc_system', 'delay_cause']
+ROLLING_COLUMNS = ['date', 'delay_minutes', 'ptc_system', 'delay_cause']
+
+# A window is a burst when a Poisson process at the group's average rate would reach its count
+# anywhere in the group's span with probability below BURST_ALPHA (and it holds BURST_MIN_COUNT delays)
+BURST_ALPHA = 0.01
+BURST_MIN_COUNT = 3
+BURST_COLUMNS = ['window', 'start', 'end', 'delays', 'peak_count', 'expected_count', 'threshold']
+
+
+def _group_codes(results_df, by):
+    """One integer code per group of the `by` columns (missing labels form their own group)"""
+    if not by:
+        return np.zeros(len(results_df), dtype=np.int64), pd.DataFrame(index=[0])
+    keys = results_df[by].astype(object).where(results_df[by].notna(), 'Unmatched')
+    codes = keys.groupby(by, sort=True).ngroup().to_numpy().astype(np.int64)
+    groups = keys.drop_duplicates().sort_values(by).reset_index(drop=True)
+    return codes, groups
+
+
+def rolling_windows(results_df, windows=WINDOWS, by=GROUP_COLUMNS):
+    """Trailing count and minute sum of every window at every delay, per group
+
+    Delays are sorted once by (group, time). Each window's left edge comes from one vectorized
+    searchsorted over the same sorted keys, and counts / minute sums are differences of the
+    running totals, so adding a window costs one pass instead of a regroup.
+    """
+    times = pd.to_datetime(results_df['date'], errors='coerce')
+    dated = times.notna().to_numpy()
+    frame = results_df[dated].reset_index(drop=True)
+    seconds = times[dated].to_numpy(dtype='datetime64[s]').astype(np.int64)
+    codes, groups = _group_codes(frame, by)
+
+    # Groups are laid end to end on one time axis, each shifted past the previous one's windows
+    widest = max(int(pd.Timedelta(window).total_seconds()) for window in windows)
+    origin = seconds.min() if len(seconds) else 0
+    stride = (seconds.max() - origin if len(seconds) else 0) + widest + 1
+    keys = codes * stride + (seconds - origin)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+
+    minutes = pd.to_numeric(frame['delay_minutes'], errors='coerce').to_numpy(dtype=float)[order]
+    running_minutes = np.concatenate([[0.0], np.cumsum(np.where(np.isnan(minutes), 0.0, minutes))])
+    position = np.arange(len(keys))
+
+    rolled = frame.iloc[order].reset_index(drop=True)
+    rolled['group'] = codes[order]
+    for window in windows:
+        width = int(pd.Timedelta(window).total_seconds())
+        left = np.searchsorted(keys, keys - width, side='right')
+        rolled[f'count_{window}'] = position - left + 1
+        rolled[f'minutes_{window}'] = running_minutes[position + 1] - running_minutes[left]
+    return rolled, groups
+
+
+def window_peaks(rolled, groups, windows=WINDOWS):
+    """Busiest trailing window per group: count, minutes and when it ended"""
+    records = []
+    for window in windows:
+        counts = rolled[f'count_{window}'].to_numpy()
+        # Last row of each group's maximum (rows are time-sorted within a group)
+        best = rolled.assign(_count=counts).sort_values(['group', '_count'], kind='stable')
+        best = best.groupby('group', sort=True).tail(1)
+        for _, row in best.iterrows():
+            records.append({**groups.iloc[int(row['group'])].to_dict(), 'window': window,
+                            'peak_count': int(row[f'count_{window}']),
+                            'peak_minutes': float(row[f'minutes_{window}']), 'window_end': row['date']})
+    return pd.DataFrame(records)
+
+
+def burst_thresholds(expected, windows_per_span, sizes, alpha=BURST_ALPHA, min_count=BURST_MIN_COUNT):
+    """Smallest count per group whose Poisson tail, over all the span's windows, is below alpha
+
+    The tail is summed from the log pmf upward from the mode, where the pmf is never tiny, so
+    large expectations (7D windows at scale) do not underflow. Groups whose tail never gets
+    there get a threshold above their size, so none of their windows is flagged.
+    """
+    limit = alpha / np.maximum(windows_per_span, 1.0)
+    thresholds = np.asarray(sizes, dtype=np.int64) + 1
+    for group, lam in enumerate(expected):
+        if lam <= 0:
+            thresholds[group] = 1
+            continue
+        # Below the mode the tail is at least about one half, far above any limit
+        mode = int(np.floor(lam))
+        k = np.arange(mode, int(np.ceil(lam + 40 * np.sqrt(lam) + 50)) + 1)
+        log_pmf = k * np.log(lam) - lam - np.array([math.lgamma(value + 1) for value in k])
+        tail = np.cumsum(np.exp(log_pmf)[::-1])[::-1]  # P(X >= k); terms past the range are negligible
+        below = np.flatnonzero(tail <= limit[group])
+        if len(below):
+            thresholds[group] = k[below[0]]
+    return np.maximum(thresholds, min_count)
+
+
+def detect_bursts(rolled, groups, window='1h', alpha=BURST_ALPHA, min_count=BURST_MIN_COUNT):
+    """Runs of delays whose trailing window count is far above the group's average rate"""
+    times = rolled['date'].to_numpy(dtype='datetime64[s]').astype(np.int64)
+    group = rolled['group'].to_numpy()
+    counts = rolled[f'count_{window}'].to_numpy()
+    width = pd.Timedelta(window).total_seconds()
+
+    # Expected delays per window from each group's overall rate
+    sizes = np.bincount(group, minlength=len(groups))
+    first = np.full(len(groups), np.iinfo(np.int64).max)
+    last = np.full(len(groups), np.iinfo(np.int64).min)
+    np.minimum.at(first, group, times)
+    np.maximum.at(last, group, times)
+    span = np.maximum(last - first, width).astype(float)
+    expected = sizes * width / span
+    thresholds = burst_thresholds(expected, span / width, sizes, alpha, min_count)
+
+    flagged = counts >= thresholds[group]
+    new_group = np.concatenate([[True], group[1:] != group[:-1]])
+    starts = flagged & (new_group | ~np.concatenate([[False], flagged[:-1]]))
+    run = np.cumsum(starts) - 1
+    if not flagged.any():
+        return pd.DataFrame(columns=list(groups.columns) + BURST_COLUMNS)
+
+    runs = pd.DataFrame({'run': run[flagged], 'group': group[flagged], 'date': rolled['date'].to_numpy()[flagged],
+                         'count': counts[flagged]})
+    bursts = runs.groupby('run').agg(group=('group', 'first'), end=('date', 'max'), peak_count=('count', 'max'),
+                                     delays=('count', 'size'))
+    first_rows = runs.groupby('run')['date'].min()
+    bursts['start'] = first_rows - pd.Timedelta(window)
+    bursts['expected_count'] = expected[bursts['group'].to_numpy()]
+    bursts['threshold'] = thresholds[bursts['group'].to_numpy()]
+    labels = groups.iloc[bursts['group'].to_numpy()].reset_index(drop=True)
+    bursts = pd.concat([labels, bursts.reset_index(drop=True).drop(columns='group')], axis=1)
+    bursts['window'] = window
+    return bursts[list(groups.columns) + BURST_COLUMNS]
+
+
+def time_of_day(results_df, by=GROUP_COLUMNS[:1]):
+    """Delays and minutes per hour of day (0-23) for each group"""
+    times = pd.to_datetime(results_df['date'], errors='coerce')
+    dated = times.notna().to_numpy()
+    frame = results_df[dated].reset_index(drop=True)
+    codes, groups = _group_codes(frame, by)
+    hours = times[dated].dt.hour.to_numpy()
+    cell = codes * 24 + hours
+    minutes = pd.to_numeric(frame['delay_minutes'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    delays = np.bincount(cell, minlength=len(groups) * 24).reshape(len(groups), 24)
+    total = np.bincount(cell, weights=minutes, minlength=len(groups) * 24).reshape(len(groups), 24)
+    table = groups.loc[groups.index.repeat(24)].reset_index(drop=True)
+    table['hour'] = np.tile(np.arange(24), len(groups))
+    table['delays'] = delays.ravel()
+    table['delay_minutes'] = total.ravel()
+    return table
+
+
+def main(years=None, windows=WINDOWS, burst_window='1h', store=results_store.RESULTS_STORE):
+    results_df = results_store.require_results(store, years=years, columns=ROLLING_COLUMNS)
+    results_df = results_df[results_df['ptc_system'].notna()]
+    if burst_window not in windows:
+        windows = list(windows) + [burst_window]
+
+    rolled, groups = rolling_windows(results_df, windows)
+    print(f"Rolling windows {', '.join(windows)} over {len(rolled)} matched delays in {len(groups)} groups")
+    times = pd.to_datetime(results_df['date'], errors='coerce').dropna()
+    timed = bool((times != times.dt.normalize()).any())
+    if not timed:
+        print("Note: delay timestamps carry no time of day; windows shorter than a day see whole days")
+
+    print("\nBusiest windows:")
+    print(window_peaks(rolled, groups, windows).to_string(index=False, float_format='%.1f'))
+
+    bursts = detect_bursts(rolled, groups, burst_window)
+    print(f"\n{len(bursts)} burst(s) over {burst_window} windows:")
+    if len(bursts):
+        print(bursts.sort_values('peak_count', ascending=False).head(20).to_string(index=False, float_format='%.1f'))
+
+    if timed:
+        by_hour = time_of_day(results_df)
+        print("\nDelays by hour of day:")
+        print(by_hour.pivot(index='hour', columns='ptc_system', values='delays').to_string())
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Sliding-window PTC delay counts, bursts and time of day")
+    parser.add_argument('--years', type=int, nargs='*', default=None, help="years to read (default: all)")
+    parser.add_argument('--windows', nargs='+', default=WINDOWS, help="trailing windows, e.g. 15min 1h 1D 7D")
+    parser.add_argument('--burst-window', default='1h', help="window used for burst detection")
+    parser.add_argument('--store', default=results_store.RESULTS_STORE)
+    args = parser.parse_args(argv)
+    main(years=args.years, windows=args.windows, burst_window=args.burst_window, store=args.store)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,258 @@
+import io
+import os
+import json
+import time
+import argparse
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+import ptc_delay_analysis_final as ptc
+from ptc_cube import CUBE_DIMENSIONS, build_delay_cube, rollup
+import ptc_location_index as location_index
+import ptc_quality as quality
+
+# Local JSON service keeping the parsed inputs, matching indexes, results and cube in memory
+HOST = '127.0.0.1'
+PORT = 8765
+
+ENDPOINTS = ['/status', '/match', '/aggregate', '/hotspots', '/locations', '/summary']
+
+# Cube dimensions holding numbers (query values are compared as numbers, not text)
+NUMERIC_DIMENSIONS = ['year', 'month']
+
+
+def _plain(value):
+    """numpy scalars / NaN to JSON-friendly Python values"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+class WarmIndexes:
+    """Inputs parsed once; an input is re-read only when its files' mtimes change"""
+
+    def __init__(self, chrono_files=ptc.CHRONO_FILE, summary_files=ptc.SUMMARY_FILE,
+                 starts_files=ptc.STARTS_FILE, roster_file=ptc.ROSTER_FILE, use_cache=None):
+        self.specs = {'chrono': chrono_files, 'summary': summary_files,
+                      'starts': starts_files, 'roster': roster_file}
+        self.use_cache = use_cache
+        self.versions = {}
+        self.loaded_at = {}
+        self.reloads = 0
+        self.lock = threading.RLock()
+        self.refresh()
+
+    def _files(self, kind):
+        return ptc.input_files(kind, self.specs[kind])
+
+    def _version(self, kind):
+        stats = [(path, os.stat(path)) for path in self._files(kind)]
+        return tuple((path, stat.st_mtime_ns, stat.st_size) for path, stat in stats)
+
+    def _load(self, kind):
+        frame = ptc.load_input(kind, self.specs[kind], self.use_cache)
+        with contextlib.redirect_stdout(io.StringIO()):
+            if kind == 'chrono':
+                self.ptc_delays = ptc.filter_ptc_delays(frame)
+            elif kind == 'summary':
+                self.summary_index = ptc.extract_equipment_from_summary(frame)
+            elif kind == 'starts':
+                self.starts_index = ptc.build_starts_index(frame)
+            else:
+                self.equipment_ptc = ptc.process_ptc_roster(frame)
+
+    def refresh(self):
+        """Reload changed inputs and rematch; returns the kinds that were reloaded"""
+        with self.lock:
+            changed = []
+            for kind in self.specs:
+                version = self._version(kind)
+                if self.versions.get(kind) != version:
+                    self._load(kind)
+                    self.versions[kind] = version
+                    self.loaded_at[kind] = time.strftime('%Y-%m-%dT%H:%M:%S')
+                    changed.append(kind)
+            if changed:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self.results_df = ptc.match_delays_to_equipment(
+                        self.ptc_delays, self.summary_index, self.starts_index, self.equipment_ptc
+                    )
+                self.cube = build_delay_cube(self.results_df)
+                self.location_index = location_index.build_location_index(self.results_df)
+                self.reloads += 1
+            return changed
+
+    def status(self):
+        return {
+            'inputs': {kind: [path for path, _, _ in self.versions[kind]] for kind in self.specs},
+            'loaded_at': self.loaded_at,
+            'reloads': self.reloads,
+            'ptc_delays': len(self.ptc_delays),
+            'summary_index_entries': len(self.summary_index['key']),
+            'starts_index_entries': len(self.starts_index),
+            'roster_equipment': ptc.roster_counts(self.equipment_ptc),
+            'matched_delays': int(self.results_df['ptc_system'].notna().sum()),
+            'quality': quality.report()['checks']
+        }
+
+    def match(self, train_id, date=None):
+        """Equipment and PTC system for one train on one service date"""
+        dates = pd.to_datetime(pd.Series([date]), errors='coerce')
+        service_key, day_code = ptc.service_calendar(dates)
+        summary_lead, engine_type, found = ptc.lookup_summary_equipment(
+            self.summary_index, pd.Series([str(train_id)]), dates, equipment_ptc=self.equipment_ptc
+        )
+        starts = ptc.lookup_starts(self.starts_index, train_id, int(service_key[0]))
+        if found[0]:
+            lead = summary_lead[0]
+        elif starts is not None:
+            lead = ptc.resolve_cab_units(*ptc.consist_codes([starts['equipment']]), self.equipment_ptc)[0]
+        else:
+            lead = np.nan
+        system = ptc.PTC_SYSTEMS[ptc.ptc_system_codes(self.equipment_ptc, [lead])[0]]
+        return {
+            'train_id': ptc.normalize_train_ids([train_id])[0],
+            'date': None if pd.isna(dates[0]) else dates[0].strftime('%Y-%m-%d'),
+            'day_of_week': day_code[0],
+            'source': 'summary' if found[0] else ('starts' if starts is not None else None),
+            'lead_equipment': None if pd.isna(lead) else int(lead),
+            'ptc_system': system,
+            'engine_type': engine_type[0] if found[0] else None,
+            'starts_yard': None if starts is None else _plain(starts['yard']),
+            'starts_equipment': None if starts is None else [str(item) for item in starts['equipment_list']]
+        }
+
+    def aggregate(self, by, filters):
+        """Delays / minutes / mean rolled up from the cube (train_id filters fall back to the rows)"""
+        unknown = [dim for dim in list(by) + list(filters) if dim not in CUBE_DIMENSIONS + ['train_id']]
+        if unknown or 'train_id' in by:
+            raise ValueError(f"Unsupported dimension(s) {unknown or ['train_id']}; use {CUBE_DIMENSIONS}")
+        cube = self.cube
+        if 'train_id' in filters:
+            train_ids = ptc.normalize_train_ids(filters['train_id'])
+            rows = self.results_df[self.results_df['train_id'].isin(train_ids.dropna())]
+            cube = build_delay_cube(rows)
+        for dim, values in filters.items():
+            if dim in NUMERIC_DIMENSIONS:
+                cube = cube[cube[dim].isin([float(value) for value in values])]
+            elif dim != 'train_id':
+                cube = cube[cube[dim].astype(str).isin(values)]
+        if not by:
+            return {'delays': int(cube['delays'].sum()), 'delay_minutes': float(cube['delay_minutes'].sum())}
+        return json.loads(rollup(cube, by).to_json(orient='records'))
+
+    def hot_spots(self, ptc_system, n, by, start=None, end=None):
+        """Top-n locations for one PTC system"""
+        spots = location_index.hot_spots(self.location_index, ptc_system, n=n, by=by, start=start, end=end)
+        return json.loads(spots.to_json(orient='records'))
+
+    def locations(self, locations, start=None, end=None):
+        """Per-location and segment totals per PTC system"""
+        return {
+            'locations': json.loads(location_index.location_stats(
+                self.location_index, locations, start, end).to_json(orient='records')),
+            'segment': json.loads(location_index.segment_stats(
+                self.location_index, locations, start, end).to_json(orient='records'))
+        }
+
+    def summary(self, year):
+        """The answers analyze_results prints, for one year"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            answers = ptc.report_summary(self.cube, self.equipment_ptc, year=year)
+        return {name: _plain(value) for name, value in answers.items()}
+
+
+def _query_params(query):
+    """Query string to {name: [values]}; comma-separated values are split"""
+    return {name: [item for value in values for item in value.split(',') if item]
+            for name, values in parse_qs(query).items()}
+
+
+def make_handler(indexes):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = _query_params(url.query)
+            started = time.perf_counter()
+            try:
+                reloaded = indexes.refresh()
+                with indexes.lock:
+                    if url.path == '/status':
+                        result = indexes.status()
+                    elif url.path == '/match':
+                        result = indexes.match(params['train_id'][0], params.get('date', [None])[0])
+                    elif url.path == '/aggregate':
+                        by = params.pop('by', [])
+                        result = indexes.aggregate(by, params)
+                    elif url.path == '/hotspots':
+                        result = indexes.hot_spots(params.get('ptc_system', ['Alstom'])[0],
+                                                   int(params.get('n', ['10'])[0]), params.get('by', ['delays'])[0],
+                                                   params.get('start', [None])[0], params.get('end', [None])[0])
+                    elif url.path == '/locations':
+                        result = indexes.locations(params['location'], params.get('start', [None])[0],
+                                                   params.get('end', [None])[0])
+                    elif url.path == '/summary':
+                        result = indexes.summary(int(params.get('year', ['2024'])[0]))
+                    else:
+                        self._send(404, {'error': f"Unknown endpoint '{url.path}'",
+                                         'endpoints': ENDPOINTS})
+                        return
+            except (KeyError, ValueError) as err:
+                self._send(400, {'error': str(err.args[0]) if err.args else repr(err)})
+                return
+            except FileNotFoundError as err:
+                self._send(503, {'error': str(err)})
+                return
+            self._send(200, {'result': result, 'reloaded': reloaded,
+                             'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(indexes, host=HOST, port=PORT):
+    server = ThreadingHTTPServer((host, port), make_handler(indexes))
+    print(f"PTC analysis service on http://{host}:{server.server_port} "
+          f"({', '.join(ENDPOINTS)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Local JSON service answering PTC match and aggregate queries")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--chrono', nargs='+', default=[ptc.CHRONO_FILE], help="CHRONO extract files or glob patterns")
+    parser.add_argument('--summary', nargs='+', default=[ptc.SUMMARY_FILE], help="summary workbooks or glob patterns")
+    parser.add_argument('--starts', default=ptc.STARTS_FILE)
+    parser.add_argument('--roster', default=ptc.ROSTER_FILE)
+    args = parser.parse_args(argv)
+
+    print("Loading inputs and building indexes...")
+    started = time.perf_counter()
+    indexes = WarmIndexes(args.chrono, args.summary, args.starts, args.roster)
+    print(f"Ready in {time.perf_counter() - started:.1f}s: {indexes.status()['ptc_delays']} PTC delays")
+    serve(indexes, args.host, args.port)
+
+
+if __name__ == "__main__":
+    cli()
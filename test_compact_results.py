@@ -0,0 +1,38 @@
+import pandas as pd
+import ptc_delay_analysis_final as ptc
+import ptc_results_store as results_store
+
+
+def _results(minutes, engine_types):
+    n = len(minutes)
+    return pd.DataFrame({
+        'date': ['2024-03-04'] * n,
+        'train_id': [str(3800 + i) for i in range(n)],
+        'delay_cause': ['NJT PTC'] * n,
+        'delay_minutes': minutes,
+        'lead_equipment': [4601] * n,
+        'ptc_system': ['Alstom'] * n,
+        'engine_type': engine_types,
+        'day_of_week': ['MF'] * n,
+        'location': ['Newark'] * n
+    })[ptc.RESULT_COLUMNS]
+
+
+def test_fractional_minutes_stay_floats():
+    results_df = ptc.compact_results(_results([7.5, 3, None], ['ALP46', 'ALP46', 'ALP46']))
+    assert str(results_df['delay_minutes'].dtype) == 'Float64'
+    assert results_df['delay_minutes'].tolist()[:2] == [7.5, 3.0]
+
+    csv = results_store.csv_frame(results_df).to_csv(index=False)
+    assert ',7.5,' in csv and ',3.0,' in csv
+
+
+def test_whole_minutes_become_ints():
+    results_df = ptc.compact_results(_results([7.0, 3, None], ['ALP46', 'ALP46', 'ALP46']))
+    assert str(results_df['delay_minutes'].dtype) == 'Int64'
+
+
+def test_mixed_label_types_get_categories():
+    results_df = ptc.compact_results(_results([5, 6, 7], [4600, 'ALP46', None]))
+    assert list(results_df['engine_type'].cat.categories) == [4600, 'ALP46']
+    assert results_df['engine_type'].tolist()[:2] == [4600, 'ALP46']